@@ -1,20 +1,17 @@
-import logging
-import json
+import hashlib
+import os
 import requests
-import pandas as pd
+import threading
 import time
+from collections import deque
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from Class_RateLimiter import KeyRateLimiter
+from Class_ResponseCache import ResponseCache
+from Class_Metrics import metrics
+from NASDAQ_config import config, get_logger
 
-with open("conf.json") as f:
-    config = json.load(f)
-
-# logging config
-logger = logging.getLogger("API_datacollector")
-logger.setLevel(logging.INFO)
-
-handler = logging.FileHandler("logs/API_datacollector.log", mode="w")
-formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+logger = get_logger("API_datacollector")
 
 
 def check_database_exists(connection):
@@ -30,77 +27,273 @@ def check_database_exists(connection):
     return stocks_exists and stocks_prices_exists
 
 
-def call_info_stocks_api(ticker, info_token_flag):
+class ThrottledError(Exception):
+    """
+    Raised when Alpha Vantage answers with a throttle message instead of data.
+    """
+
+
+class QuotaSpentError(Exception):
+    """
+    Raised when the daily quota of an API key is spent.
+    """
+
+
+class CacheMissError(Exception):
+    """
+    Raised in offline mode when a response is not in the cache.
+    """
+
+
+# one rate limiter per API key, created by get_limiter
+limiters = {}
+
+# the on-disk response cache, created by get_response_cache
+response_cache = None
+MARKET_TIMEZONE = ZoneInfo("America/New_York")
+MARKET_CLOSE_HOUR = 16
+
+
+def get_limiter(token):
     """
-    Returns DataFrame containing the information about the ticker.
-    Returns a boolean flag representing if the queries are spent from the token.
+    Returns the rate limiter of the API key, sized from the per-minute and per-day quotas in the conf file.
+    The daily quota spent by the key is kept in the API_CACHE dir, so it carries over to the next run.
     """
-    logger.info(f"getting info on {ticker}")
+    if token not in limiters:
+        os.makedirs(config['API_CACHE']['dir'], exist_ok=True)
+        state_file = os.path.join(config['API_CACHE']['dir'],
+                                  f"quota_{hashlib.sha1(token.encode('utf-8')).hexdigest()[:16]}.json")
+        limiters[token] = KeyRateLimiter(config['API']['per_minute'], config['API']['per_day'], state_file)
+    return limiters[token]
+
+
+def get_response_cache():
+    """
+    Returns the on-disk response cache configured in the API_CACHE section of the conf file.
+    """
+    global response_cache
+    if response_cache is None:
+        response_cache = ResponseCache(config['API_CACHE']['dir'], config['API_CACHE']['max_mb'] * 1024 * 1024)
+    return response_cache
+
+
+def set_offline(offline=True):
+    """
+    Sets the offline mode, in which API responses are only replayed from the cache.
+    """
+    config['API_CACHE']['offline'] = offline
+
+
+def next_market_close(now=None):
+    """
+    Returns the timestamp of the next US market close (16:00 New York time on a weekday) after now.
+    """
+    now = datetime.fromtimestamp(now or time.time(), MARKET_TIMEZONE)
+    close = now.replace(hour=MARKET_CLOSE_HOUR, minute=0, second=0, microsecond=0)
+    if close <= now:
+        close += timedelta(days=1)
+    while close.weekday() >= 5:
+        close += timedelta(days=1)
+    return close.timestamp()
+
+
+def response_expiry(function):
+    """
+    Returns the timestamp until which a response of the API function stays valid: OVERVIEW responses for
+    overview_ttl_days, daily series until the next market close.
+    """
+    if function == 'OVERVIEW':
+        return time.time() + config['API_CACHE']['overview_ttl_days'] * 24 * 60 * 60
+    return next_market_close()
+
+
+def call_api(params, token):
+    """
+    Returns the json response of an Alpha Vantage call, from the response cache when it holds a valid one.
+    Raises ThrottledError if the API answered with a throttle message, QuotaSpentError if the daily quota of the key
+    is spent and CacheMissError if the response is not cached in offline mode.
+    """
+    cache = get_response_cache()
+    key = ":".join(str(params[name]) for name in sorted(params))
+    function = params['function']
+    offline = config['API_CACHE']['offline']
+    # offline, the responses on disk are replayed even once they expired
+    response = cache.get(key, ignore_expiry=offline)
+    if response is not None:
+        metrics.inc('api_cache_total', function=function, result='hit')
+        return response
+    metrics.inc('api_cache_total', function=function, result='miss')
+    if offline:
+        raise CacheMissError(key)
+    if not get_limiter(token).acquire():
+        metrics.inc('api_quota_spent_total', function=function)
+        raise QuotaSpentError(key)
+    metrics.inc('api_calls_total', function=function)
+    with metrics.timer('api_call_seconds', function=function):
+        response = requests.get(config['API']['url'], params={**params, 'apikey': token},
+                                timeout=config['TIMEOUT']).json()
+    # Alpha Vantage answers throttled calls with status 200 and a 'Note' (or 'Information') message
+    if 'Note' in response or 'Information' in response:
+        metrics.inc('api_throttled_total', function=function)
+        raise ThrottledError(response.get('Note') or response.get('Information'))
+    if 'Error Message' not in response:
+        cache.put(key, response, response_expiry(function))
+    return response
+
+
+def call_info_stocks_api(ticker):
+    """
+    Returns DataFrame containing the information about the ticker, empty when the response has no Symbol (an error
+    message or an unknown ticker).
+    Raises ThrottledError if the API throttled the call.
+    """
+    import pandas as pd
+    logger.info("getting info on %s", ticker)
     tick_info = []
-    info_token = config['API']['info_token']
-    api_url = f"https://www.alphavantage.co/query?function=OVERVIEW&symbol={ticker}&apikey={info_token}"
-    response = requests.get(api_url)
-    response = response.json()
-
-    if 'Note' in response:
-        info_token_flag = False
-    if info_token_flag:
+    response = call_api({'function': 'OVERVIEW', 'symbol': ticker}, config['API']['info_token'])
+    if "Symbol" in response:
         tick_info.append(response)
+    else:
+        logger.error(f'No information for {ticker}: {response}')
     tick_info_df = pd.DataFrame(tick_info)
-    return tick_info_df, info_token_flag
+    return tick_info_df
 
 
-def call_price_stocks_api(ticker, price_token_flag):
+def call_price_stocks_api(ticker, output_size='compact'):
     """
-    Returns DataFrame containing the information about the ticker prices.
-    Returns a boolean flag representing if the queries are spent from the token.
+    Returns DataFrame containing the information about the ticker prices, the last 100 trading days for the
+    'compact' output size or the whole history for 'full'.
+    Raises ThrottledError if the API throttled the call.
     """
-    logger.info(f'Getting {ticker} price info')
+    import pandas as pd
+    logger.info('Getting %s price info', ticker)
     tick_prices_df = pd.DataFrame({})
-    price_token = config['API']['price_token']
-    api_url = f"https://www.alphavantage.co/query?function=TIME_SERIES_DAILY_ADJUSTED&symbol={ticker}&outputsize" \
-              f"=compact&apikey={price_token}"
-    response = requests.get(api_url)
-    response = response.json()
-    if 'Note' in response:
-        price_token_flag = False
-    if price_token_flag:
+    response = call_api({'function': 'TIME_SERIES_DAILY_ADJUSTED', 'symbol': ticker, 'outputsize': output_size},
+                        config['API']['price_token'])
+    if "Time Series (Daily)" in response:
+        tick_prices_df = pd.DataFrame(response["Time Series (Daily)"]).T
+    else:
+        logger.error(f'No prices for {ticker}: {response}')
+    return tick_prices_df
 
-        if response:
-            tick_prices_df = pd.DataFrame(response["Time Series (Daily)"]).T
 
-    return tick_prices_df, price_token_flag
+def run_api_queue(tickers, token, fetch, store):
+    """
+    Calls fetch(ticker) for every ticker within the rate limits of the API key and passes the result to
+    store(ticker, result). Throttled tickers are requeued after a back-off, up to max_retries times.
+    A ticker whose result could not be stored is logged and skipped. Stops when the daily quota of the key is spent.
+    """
+    limiter = get_limiter(token)
+    queue = deque((ticker, 0) for ticker in tickers)
+    while queue:
+        ticker, retries = queue.popleft()
+        try:
+            result = fetch(ticker)
+        except QuotaSpentError:
+            logger.error(f'The daily quota of the API key is spent, {len(queue) + 1} tickers were not updated')
+            return
+        except CacheMissError:
+            logger.info(f'{ticker} is not in the response cache, skipping it in offline mode')
+            continue
+        except ThrottledError as err:
+            backoff = config['API']['backoff_time'] * 2 ** retries
+            logger.info(f'{ticker} was throttled ({err}), retrying in {backoff} seconds')
+            limiter.pause(backoff)
+            if retries < config['API']['max_retries']:
+                queue.append((ticker, retries + 1))
+            else:
+                logger.error(f'{ticker} was throttled {retries + 1} times, giving up')
+            continue
+        except requests.RequestException as err:
+            logger.error(f'error calling the API for {ticker}: {err}')
+            continue
+        try:
+            store(ticker, result)
+        except Exception as err:
+            logger.error(f'error storing the API response of {ticker}: {err!r}')
+
+
+# columns of the Alpha Vantage daily series, in the order of the Stocks_Prices price columns
+PRICE_COLUMNS = ['1. open', '2. high', '3. low', '4. close']
+VOLUME_COLUMN = '6. volume'
+INFO_COLUMNS = ['Name', 'Currency', 'Country', 'Sector', 'Industry', 'Symbol']
 
 
 def update_stocks(tick_info, connection):
     """
     Gets a DataFrame containing the ticker information, and updates the Stocks Table using the information.
+    The fields missing from the information are set to NULL.
+    All the rows are updated with one executemany and committed once.
+    """
+    info = tick_info.reindex(columns=INFO_COLUMNS)
+    cursor = connection.cursor()
+    cursor.executemany('UPDATE Stocks SET name = %s, currency = %s, country = %s, sector = %s, industry = %s '
+                       'WHERE stock_tick = %s', info.astype(object).where(info.notna(), None)
+                       .itertuples(index=False, name=None))
+    connection.commit()
+
+
+def price_rows(prices, stock_id):
     """
-    for i, row in tick_info.iterrows():
-        cursor = connection.cursor()
-        cursor.execute(f'UPDATE Stocks SET name = %s, currency = %s, country = %s, sector = %s, industry = %s '
-                       f'WHERE stock_tick = %s;', (row['Name'], row['Currency'], row['Country'], row['Sector'],
-                                                   row['Industry'], row['Symbol'],))
-        connection.commit()
+    Gets a DataFrame of Alpha Vantage daily prices and returns the Stocks_Prices rows of the stock.
+    The columns are converted to typed NumPy arrays once instead of row by row.
+    """
+    import numpy as np
+    import pandas as pd
+    dates = pd.to_datetime(prices.index).to_pydatetime()
+    ohlc = prices[PRICE_COLUMNS].to_numpy(dtype=np.float64).round(4)
+    volume = prices[VOLUME_COLUMN].to_numpy(dtype=np.int64)
+    return list(zip([stock_id] * len(dates), dates, *ohlc.T.tolist(), volume.tolist()))
 
 
 def insert_stock_prices(prices, ticker, connection):
     """
     Gets a DataFrame containing the ticker prices and name, and updates the Stocks Table using the information.
+    All the prices are written with one multi-row insert and committed once; the dates already stored for the stock
+    are skipped by the (stock_id, date) unique key. The last_price_date watermark of the stock is moved forward in
+    the same transaction.
     """
+    if prices.empty:
+        return
     cursor = connection.cursor()
     cursor.execute('SELECT stock_id FROM Stocks where stock_tick = %s', (ticker,))
     stock_id = cursor.fetchone()['stock_id']
-    for i, row in prices.iterrows():
-        cursor.execute("INSERT INTO Stocks_Prices (stock_id, date, open, high, low, close, volume) VALUES (%s,"
-                       " %s, %s, %s, %s, %s, %s)", (stock_id, row.name, row['1. open'], row['2. high'], row['3. low'],
-                                                    row['4. close'], row['6. volume']))
-        connection.commit()
+    rows = price_rows(prices, stock_id)
+    cursor.executemany("INSERT IGNORE INTO Stocks_Prices (stock_id, date, open, high, low, close, volume) "
+                       "VALUES (%s, %s, %s, %s, %s, %s, %s)", rows)
+    last_date = max(row[1] for row in rows).date()
+    cursor.execute("UPDATE Stocks SET last_price_date = GREATEST(COALESCE(last_price_date, %s), %s) "
+                   "WHERE stock_id = %s", (last_date, last_date, stock_id))
+    connection.commit()
+
+
+def last_market_close_date():
+    """
+    Returns the date of the last US market close (16:00 New York time on a weekday), holidays are not considered.
+    """
+    now = datetime.now(MARKET_TIMEZONE)
+    day = now.date() if now.hour >= MARKET_CLOSE_HOUR else now.date() - timedelta(days=1)
+    while day.weekday() >= 5:
+        day -= timedelta(days=1)
+    return day
+
+
+def price_output_size(last_date, close_date):
+    """
+    Returns the Alpha Vantage outputsize that covers the prices missing since last_date: 'compact' (the last
+    compact_days trading days) when the gap fits in it, else 'full'.
+    """
+    import numpy as np
+    if last_date is None or np.busday_count(last_date, close_date) >= config['API']['compact_days']:
+        return 'full'
+    return 'compact'
 
 
 def update_stock_prices(connection):
     """
     Updates the Table Stocks_Prices, with the most recent available prices without duplicates.
+    The stocks to update are read from the indexed last_price_date watermark of the Stocks table, including the
+    stocks that have no prices yet.
     """
 
     if not check_database_exists(connection):
@@ -108,61 +301,65 @@ def update_stock_prices(connection):
         return
 
     cursor = connection.cursor()
-    # Query to get the last date the price was updated with the ticker name.
-    cursor.execute("SELECT jj.stock_tick AS stock_tick, jj.MAX_DATE AS last_date FROM ("
-                   "SELECT j.stock_tick AS stock_tick, DATE(MAX(j.date)) AS MAX_DATE FROM ("
-                   "SELECT stock_tick, date FROM Stocks_Prices LEFT JOIN Stocks ON "
-                   "Stocks_Prices.stock_id = Stocks.stock_id) AS j GROUP BY j.stock_tick ORDER BY MAX(date)) AS jj "
-                   "WHERE jj.MAX_DATE < CURDATE()")
-    last_prices = pd.DataFrame(cursor.fetchall())
-    if last_prices.empty:
+    close_date = last_market_close_date()
+    cursor.execute("SELECT stock_tick, last_price_date FROM Stocks "
+                   "WHERE last_price_date IS NULL OR last_price_date < %s ORDER BY last_price_date", (close_date,))
+    last_prices = cursor.fetchall()
+    if not last_prices:
         logger.info("No stock tickers available for update.")
         return
-    price_token_flag = True
-    for i, ticker in enumerate(last_prices['stock_tick']):
-        if price_token_flag:
-            tick_prices_df, price_token_flag = call_price_stocks_api(ticker, price_token_flag)
-            if not tick_prices_df.empty:
-                last_prices['last_date'] = pd.to_datetime(last_prices['last_date'])
-                tick_prices_df.index = pd.to_datetime(tick_prices_df.index)
-                tick_prices_df_new = tick_prices_df[tick_prices_df.index > last_prices['last_date'][i]]
-                insert_stock_prices(tick_prices_df_new, ticker, connection)
-                logger.info(f' "{ticker}" was updated in the Stocks_Prices table.')
+    last_dates = {row['stock_tick']: row['last_price_date'] for row in last_prices}
+    output_sizes = {ticker: price_output_size(last_date, close_date) for ticker, last_date in last_dates.items()}
+    logger.info(f"Updating {len(last_dates)} tickers, "
+                f"{sum(size == 'full' for size in output_sizes.values())} of them with the full price history")
+
+    def fetch_prices(ticker):
+        return call_price_stocks_api(ticker, output_sizes[ticker])
+
+    def store_prices(ticker, tick_prices_df):
+        import pandas as pd
+        if not tick_prices_df.empty:
+            tick_prices_df.index = pd.to_datetime(tick_prices_df.index)
+            if last_dates[ticker] is not None:
+                tick_prices_df = tick_prices_df[tick_prices_df.index > pd.Timestamp(last_dates[ticker])]
+            insert_stock_prices(tick_prices_df, ticker, connection)
+            logger.info(f' "{ticker}" was updated in the Stocks_Prices table.')
+
+    run_api_queue(list(last_dates), config['API']['price_token'], fetch_prices, store_prices)
+    logger.info(f'Response cache - {get_response_cache()}')
 
 
 def new_tickers(connection):
     """
     Adds the tickers Information and stock prices to DataBase for stocks with no information.
+    The information and prices use separate API keys, so the two queues run concurrently.
     """
     if not check_database_exists(connection):
         logger.error("Database or required tables do not exist.")
         return
 
     cursor = connection.cursor()
-    cursor.execute('SELECT stock_tick FROM Stocks where name IS NULL')
+    cursor.execute('SELECT stock_tick FROM Stocks where name IS NULL LIMIT %s', (config['API']['query_limit'],))
     tickers = cursor.fetchall()
     tickers = [ticker['stock_tick'] for ticker in tickers]
-    for i, ticker in enumerate(tickers):
-        info_token_flag = True
-        if i > config['API']['query_limit']:
-            break
-        if (i > 0) and (i % 2 == 0):
-            time.sleep(config['API']['sleep_time'])
-
-        if info_token_flag:
-            tick_info_df, info_token_flag = call_info_stocks_api(ticker, info_token_flag)
-            if not tick_info_df.empty:
+    # the two queues share the connection
+    db_lock = threading.Lock()
+
+    def store_info(ticker, tick_info_df):
+        if not tick_info_df.empty:
+            with db_lock:
                 update_stocks(tick_info_df, connection)
-                logger.info(f' "{ticker}" was updated in the Stocks table. ')
+            logger.info(f' "{ticker}" was updated in the Stocks table. ')
 
-        price_token_flag = True
-        if price_token_flag:
-            tick_prices_df, price_token_flag = call_price_stocks_api(ticker, price_token_flag)
-            if not tick_prices_df.empty:
+    def store_prices(ticker, tick_prices_df):
+        if not tick_prices_df.empty:
+            with db_lock:
                 insert_stock_prices(tick_prices_df, ticker, connection)
-                logger.info(f' "{ticker}" was updated in the Stocks_Prices table. ')
-
-
-
-
+            logger.info(f' "{ticker}" was updated in the Stocks_Prices table. ')
 
+    info_queue = threading.Thread(target=run_api_queue,
+                                  args=(tickers, config['API']['info_token'], call_info_stocks_api, store_info))
+    info_queue.start()
+    run_api_queue(tickers, config['API']['price_token'], call_price_stocks_api, store_prices)
+    info_queue.join()
+    logger.info(f'Response cache - {get_response_cache()}')
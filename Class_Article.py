@@ -1,9 +1,36 @@
+import time
+
+from bs4 import BeautifulSoup
+
+# lxml builds a different tree from nested block markup (a <div> or <p> inside a <p>) and loses the text of the
+# inner blocks, so the article pages are parsed with html.parser. The whole page is parsed: end tags of unclosed
+# blocks (a </div> closing an open <p>) only nest the same way when every tag is in the tree.
+HTML_PARSER = "html.parser"
+
+# the classes of the blocks holding the article information
+TITLE_CLASS = "jupiter22-c-hero-article-title"
+AUTHOR_CLASS = "jupiter22-c-author-byline__author-no-link"
+DATE_CLASS = "jupiter22-c-author-byline__timestamp"
+TAGS_CLASS = "jupiter22-c-tags-container"
+TICKERS_CLASS = "jupiter22-c-related-stocks-horizontal__list"
+
+
+def make_soup(content):
+    """
+    Returns a soup object of an article page, built with html.parser.
+    """
+    return BeautifulSoup(content, HTML_PARSER)
+
+
 class Article:
     """
     Class Article holds information about a news article from Nasdaq.com/markets.
     Information includes: id, title, author, date, and tags.
+    The attributes are slots, so an Article carries no per-instance dict.
     """
 
+    __slots__ = ('title', 'author', 'date', 'tags', 'article_content', 'tickers', 'id_num', 'url')
+
     def __init__(self, id_num, url, title=None, author=None, date=None, tags=None, article_content=None,
                  tickers=None):
         if tickers is None:
@@ -20,86 +47,64 @@ class Article:
         self.url = url
 
     @staticmethod
-    def _get_title(soup):
-        """
-        Returns the name of the title of the article from the soup object.
-        """
-        title_block = soup.find('h1', {'class': "jupiter22-c-hero-article-title"})
-        if title_block:
-            title = title_block.get_text().strip()
-            return title
-        else:
-            return None
-
-    @staticmethod
-    def _get_author(soup):
-        """
-        Returns the names of the author of the article from the soup object.
-        """
-        author_block = soup.find('span', {"class": "jupiter22-c-author-byline__author-no-link"})
-        if author_block:
-            author = author_block.get_text().strip()
-        else:
-            author = "Unknown"
-        return author
+    def extract_info(soup):
+        """
+        Returns a dict with the article information extracted from the soup object in a single traversal.
+        """
+        title_block = author_block = time_stamp_block = tags_block = tickers_block = None
+        paragraphs = []
+        for tag in soup.find_all(['h1', 'span', 'p', 'div']):
+            classes = tag.get('class') or ()
+            if tag.name == 'p':
+                paragraphs.append(tag)
+                if time_stamp_block is None and DATE_CLASS in classes:
+                    time_stamp_block = tag
+            elif tag.name == 'div':
+                if tags_block is None and TAGS_CLASS in classes:
+                    tags_block = tag
+                if tickers_block is None and TICKERS_CLASS in classes:
+                    tickers_block = tag
+            elif tag.name == 'span':
+                if author_block is None and AUTHOR_CLASS in classes:
+                    author_block = tag
+            elif title_block is None and TITLE_CLASS in classes:
+                title_block = tag
 
-    @staticmethod
-    def _get_date(soup):
-        """
-        Returns the date of the article from the soup object.
-        """
-        time_stamp_block = soup.find('p', {"class": "jupiter22-c-author-byline__timestamp"})
-        if time_stamp_block:
-            time_stamp = time_stamp_block.get_text().strip()
-        else:
-            time_stamp = "Unknown"
-        return time_stamp
-
-    @staticmethod
-    def _get_tags(soup):
-
-        """
-        Returns the tags of the article from the soup object.
-        """
-        tags_block = soup.find('div', {"class": "jupiter22-c-tags-container"})
-        if tags_block:
-            tags_list = tags_block.get_text(" ").split()
-        else:
-            tags_list = ["Unknown"]
-        return tags_list
+        info = {'title': title_block.get_text().strip() if title_block else None,
+                'author': author_block.get_text().strip() if author_block else "Unknown",
+                'date': time_stamp_block.get_text().strip() if time_stamp_block else "Unknown",
+                'tags': tags_block.get_text(" ").split() if tags_block else ["Unknown"],
+                'article_content': "\n".join([p.get_text() for p in paragraphs]),
+                'tickers': tickers_block.get_text(" ").split() if tickers_block else [],
+                }
+        return info
 
-    @staticmethod
-    def _get_tickers_list(soup):
+    @classmethod
+    def from_row(cls, row):
         """
-        Returns the tickers of the article from the soup object.
+        Returns an Article object from a dict returned by row_info.
         """
-        tickers_block = soup.find('div', {"class": "jupiter22-c-related-stocks-horizontal__list"})
-        if tickers_block:
-            tickers_list = tickers_block.get_text(" ").split()
-        else:
-            tickers_list = []
-        return tickers_list
+        article = cls(row['id'], row['url'])
+        article.set_fields(row)
+        return article
 
     def set_info(self, soup):
         """
         Sets the article information to the class from the soup object.
+        The soup object can be decomposed afterwards, the information holds only plain strings.
         """
-        self.title = Article._get_title(soup)
-        self.author = Article._get_author(soup)
-        self.date = Article._get_date(soup)
-        self.tags = Article._get_tags(soup)
-        self.article_content = Article._get_article_content(soup)
-        self.tickers = Article._get_tickers_list(soup)
+        self.set_fields(Article.extract_info(soup))
 
-    @staticmethod
-    def _get_article_content(soup):
+    def set_fields(self, info):
         """
-        Returns a string containing the article content.
+        Sets the article information to the class from a dict returned by extract_info.
         """
-
-        paragraphs = soup.find_all('p')
-        content = "\n".join([p.get_text() for p in paragraphs])
-        return content
+        self.title = info['title']
+        self.author = info['author']
+        self.date = info['date']
+        self.tags = info['tags']
+        self.article_content = info['article_content']
+        self.tickers = info['tickers']
 
     def __str__(self):
         """
@@ -123,4 +128,23 @@ class Article:
                 }
         return data
 
+    def size_bytes(self):
+        """
+        Returns the approximate number of bytes of text the article holds, used to flush batches by size.
+        """
+        texts = [self.title, self.author, self.date, self.article_content, self.url] + self.tags + self.tickers
+        return sum(len(text) for text in texts if text)
+
 
+def parse_article_html(content):
+    """
+    Parses the raw HTML of an article page and returns the extracted article information as a plain dict, with the
+    parse time in seconds under 'parse_seconds'.
+    Takes and returns only picklable objects so it can run in a worker process.
+    """
+    start = time.perf_counter()
+    soup = make_soup(content)
+    info = Article.extract_info(soup)
+    soup.decompose()  # frees the tree now instead of at the next garbage collection
+    info['parse_seconds'] = time.perf_counter() - start
+    return info
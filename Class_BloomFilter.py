@@ -0,0 +1,63 @@
+import math
+import os
+
+
+class BloomFilter:
+    """
+    Class BloomFilter holds a fixed-size set of hex digests that can answer "definitely not added" without false
+    negatives, and "maybe added" with a false positive rate set by the capacity and error rate it was sized for.
+    """
+
+    def __init__(self, size_bits, num_hashes, bits=None):
+        self.size_bits = size_bits
+        self.num_hashes = num_hashes
+        self.bits = bits if bits is not None else bytearray((size_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate):
+        """
+        Returns an empty filter sized to hold capacity digests with the given false positive rate.
+        """
+        size_bits = int(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        num_hashes = max(1, round(size_bits / capacity * math.log(2)))
+        return cls(size_bits, num_hashes)
+
+    def _positions(self, digest):
+        """
+        Returns the bit positions of a hex digest (double hashing over two 64 bit slices of the digest).
+        """
+        h1 = int(digest[:16], 16)
+        h2 = int(digest[16:32], 16) | 1
+        return [(h1 + i * h2) % self.size_bits for i in range(self.num_hashes)]
+
+    def add(self, digest):
+        """
+        Adds a hex digest to the filter.
+        """
+        for position in self._positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, digest):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(digest))
+
+    def save(self, path):
+        """
+        Writes the filter to a file, replacing it atomically.
+        """
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(self.size_bits.to_bytes(8, 'big'))
+            file.write(self.num_hashes.to_bytes(2, 'big'))
+            file.write(self.bits)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Returns the filter saved in a file.
+        """
+        with open(path, 'rb') as file:
+            size_bits = int.from_bytes(file.read(8), 'big')
+            num_hashes = int.from_bytes(file.read(2), 'big')
+            bits = bytearray(file.read())
+        return cls(size_bits, num_hashes, bits)
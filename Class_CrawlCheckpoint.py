@@ -0,0 +1,157 @@
+import json
+import os
+
+
+class CrawlCheckpoint:
+    """
+    Class CrawlCheckpoint keeps the progress of a crawl on disk so an interrupted crawl can be resumed:
+    the listing pages done and the article urls found on them in a json state file, and the articles parsed but not
+    yet written to the database in a journal next to it (one json row per line).
+    Every listing page done is appended to a pages journal; the state file is only rewritten every snapshot_pages
+    pages (and when the listing or a batch is done), which empties the pages journal.
+    """
+
+    def __init__(self, path, snapshot_pages=100):
+        self.path = path
+        self.journal_path = f"{path}.journal"
+        self.pages_journal_path = f"{path}.pages"
+        self.snapshot_pages = snapshot_pages
+        self.pages = None
+        self.pages_done = set()
+        self.links = []
+        self.listing_done = False
+        self.flushed_batches = 0
+        self._journal = None
+        self._pages_journal = None
+        self._unsaved_pages = 0
+
+    def exists(self):
+        """
+        Returns True if a checkpoint was saved by an earlier crawl.
+        """
+        return os.path.exists(self.path)
+
+    def start(self, pages):
+        """
+        Starts a new checkpoint for a crawl of the given number of listing pages, dropping any earlier one.
+        """
+        self.clear()
+        self.pages = pages
+        self.save()
+
+    def load(self):
+        """
+        Loads the checkpoint of an earlier crawl.
+        Returns the article rows (Article.row_info() dicts) parsed by that crawl but not written to the database.
+        """
+        with open(self.path) as file:
+            state = json.load(file)
+        self.pages = state['pages']
+        self.pages_done = set(state['pages_done'])
+        self.links = state['links']
+        self.listing_done = state['listing_done']
+        self.flushed_batches = state['flushed_batches']
+        for entry in self._read_journal(self.pages_journal_path):
+            # the pages journal of a crawl stopped while saving a snapshot repeats pages of the state file
+            if entry['page'] not in self.pages_done:
+                self.pages_done.add(entry['page'])
+                self.links += entry['links']
+        return self._read_journal(self.journal_path)
+
+    @staticmethod
+    def _read_journal(path):
+        """
+        Returns the json rows of a journal file, an empty list if there is none.
+        """
+        rows = []
+        if os.path.exists(path):
+            with open(path) as file:
+                for line in file:
+                    try:
+                        rows.append(json.loads(line))
+                    except ValueError:
+                        break  # the last line was cut by the interruption
+        return rows
+
+    def save(self):
+        """
+        Writes the state file atomically, then empties the pages journal it now includes.
+        """
+        state = {'pages': self.pages, 'pages_done': sorted(self.pages_done), 'links': self.links,
+                 'listing_done': self.listing_done, 'flushed_batches': self.flushed_batches}
+        with open(f"{self.path}.tmp", 'w') as file:
+            json.dump(state, file)
+        os.replace(f"{self.path}.tmp", self.path)
+        self._remove_pages_journal()
+        self._unsaved_pages = 0
+
+    def _remove_pages_journal(self):
+        """
+        Closes and deletes the pages journal.
+        """
+        if self._pages_journal is not None:
+            self._pages_journal.close()
+            self._pages_journal = None
+        if os.path.exists(self.pages_journal_path):
+            os.remove(self.pages_journal_path)
+
+    def page_done(self, page, links):
+        """
+        Records a listing page as done, with the article urls found on it, by appending it to the pages journal.
+        The state file is rewritten every snapshot_pages pages, so a long crawl does not rewrite all its links
+        for every page.
+        """
+        self.pages_done.add(page)
+        self.links += links
+        if self._pages_journal is None:
+            self._pages_journal = open(self.pages_journal_path, 'a')
+        self._pages_journal.write(json.dumps({'page': page, 'links': links}) + "\n")
+        self._pages_journal.flush()
+        self._unsaved_pages += 1
+        if self._unsaved_pages >= self.snapshot_pages:
+            self.save()
+
+    def finish_listing(self):
+        """
+        Records that every listing page of the crawl is done.
+        """
+        self.listing_done = True
+        self.save()
+
+    def article_parsed(self, row):
+        """
+        Appends a parsed article row (Article.row_info() dict) to the journal.
+        """
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'a')
+        self._journal.write(json.dumps(row) + "\n")
+        self._journal.flush()
+
+    def batch_flushed(self):
+        """
+        Records that the journaled articles were written to the database and empties the journal.
+        """
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self.flushed_batches += 1
+        self.save()
+
+    def clear(self):
+        """
+        Deletes the checkpoint, once the crawl has finished.
+        """
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        self._remove_pages_journal()
+        for path in (self.path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._unsaved_pages = 0
+        self.pages_done = set()
+        self.links = []
+        self.listing_done = False
+        self.flushed_batches = 0
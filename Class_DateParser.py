@@ -0,0 +1,95 @@
+import re
+from datetime import datetime, timedelta, timezone
+
+from Class_IdCache import IdCache
+from Class_Metrics import metrics
+
+MONTHS = {name: number for number, name in enumerate(
+    ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], start=1)}
+TIMEZONES = {'EDT': -4, 'EST': -5, 'CDT': -5, 'CST': -6, 'MDT': -6, 'MST': -7, 'PDT': -7, 'PST': -8,
+             'UTC': 0, 'GMT': 0}
+UNITS = {'second': 'seconds', 'minute': 'minutes', 'hour': 'hours', 'day': 'days', 'week': 'weeks'}
+
+# "May 05, 2023", "May 05, 2023 — 10:32 am EDT", "September 5, 2023 10:32 AM"
+ABSOLUTE_DATE = re.compile(r"^(?P<month>[A-Za-z]{3,9})\.? (?P<day>\d{1,2}), (?P<year>\d{4})"
+                           r"(?:\s*[—–,-]?\s*(?P<hour>\d{1,2}):(?P<minute>\d{2})\s*(?P<ampm>[AaPp])\.?[Mm]\.?"
+                           r"(?:\s+(?P<tz>[A-Z]{3}))?)?$")
+# "3 hours ago", "an hour ago", "1 day ago"
+RELATIVE_DATE = re.compile(r"^(?P<count>\d+|an?) (?P<unit>second|minute|hour|day|week)s? ago$")
+
+
+class NasdaqDateParser:
+    """
+    Class NasdaqDateParser parses the dates of the NASDAQ listing cards and articles with compiled matchers for
+    their known formats, returning the same datetimes as dateparser.parse. Absolute dates are memoized by raw
+    string in an LRU cache; strings of unknown formats fall back to dateparser and are counted in fallbacks.
+    """
+
+    def __init__(self, cache_size=10000):
+        self.cache = IdCache(cache_size)
+        self.fallbacks = 0
+
+    def parse(self, text):
+        """
+        Returns the datetime of a NASDAQ date string, or None if it cannot be parsed.
+        """
+        text = text.strip()
+        relative = RELATIVE_DATE.match(text)
+        if relative:
+            # relative to now, so never memoized
+            count = 1 if relative['count'] in ('a', 'an') else int(relative['count'])
+            return datetime.now() - timedelta(**{UNITS[relative['unit']]: count})
+        # cached as a 1-tuple, so that the strings no format parses (None) are memoized too
+        cached = self.cache.get(text)
+        if cached is None:
+            cached = (self._parse_absolute(text),)
+            self.cache.put(text, cached)
+        return cached[0]
+
+    def _parse_absolute(self, text):
+        """
+        Returns the datetime of a date string that is not relative to now, falling back to dateparser for the
+        formats that have no matcher.
+        """
+        match = ABSOLUTE_DATE.match(text)
+        month = MONTHS.get(match['month'][:3].lower()) if match else None
+        if month is None or (match['tz'] and match['tz'] not in TIMEZONES):
+            return self._fallback(text)
+        hour = minute = 0
+        if match['hour']:
+            hour = int(match['hour']) % 12 + (12 if match['ampm'] in 'Pp' else 0)
+            minute = int(match['minute'])
+        tzinfo = timezone(timedelta(hours=TIMEZONES[match['tz']]), match['tz']) if match['tz'] else None
+        try:
+            return datetime(int(match['year']), month, int(match['day']), hour, minute, tzinfo=tzinfo)
+        except ValueError:
+            return self._fallback(text)
+
+    def _fallback(self, text):
+        """
+        Returns dateparser.parse(text) and counts the fallback.
+        """
+        import dateparser
+        self.fallbacks += 1
+        metrics.inc('date_parse_fallbacks_total')
+        return dateparser.parse(text)
+
+    def __str__(self):
+        """
+        Returns a string representation of the parser statistics.
+        """
+        message = f"Cache - {self.cache}, Fallbacks to dateparser: {self.fallbacks}"
+        return message
+
+
+# the date parser shared by the modules of the scraper
+date_parser = NasdaqDateParser()
+
+
+def parse_user_date(text):
+    """
+    Returns the datetime of a date given on the command line ("3 days ago", "2023-05-01 10:00"), parsed by dateparser.
+    dateparser is imported here, so only the runs given such a date pay its import time.
+    """
+    import dateparser
+    return dateparser.parse(text)
@@ -0,0 +1,280 @@
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from Class_Metrics import metrics
+
+try:
+    import brotli  # noqa: F401
+    ACCEPT_ENCODING = "gzip, deflate, br"
+except ImportError:
+    ACCEPT_ENCODING = "gzip, deflate"
+
+logger = logging.getLogger("NASDAQ_scraper")
+
+# gevent is imported by the methods using it, so importing this module (for requested_url) does not load it
+
+# statuses of an overloaded or throttling server, retried after a back-off
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def requested_url(response):
+    """
+    Returns the url that was requested for the response, before any redirects.
+    """
+    return response.history[0].url if response.history else response.url
+
+
+def record_fetch(response, seconds):
+    """
+    Records a fetch in the metrics, by status code ('error' for a failed request).
+    """
+    status = response.status_code if response is not None else 'error'
+    metrics.inc('http_fetches_total', status=status)
+    metrics.observe('http_fetch_seconds', seconds, status=status)
+
+
+def retry_after(response):
+    """
+    Returns the number of seconds asked by the Retry-After header of a response, or None if there is none.
+    """
+    value = response.headers.get('Retry-After') if response is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_time(attempt, response, base, maximum):
+    """
+    Returns the seconds to wait before retrying a request: the Retry-After of the response when it has one,
+    else an exponential back-off with full jitter. Never more than maximum.
+    """
+    asked = retry_after(response)
+    if asked is not None:
+        return min(asked, maximum)
+    return random.uniform(0, min(maximum, base * 2 ** attempt))
+
+
+class AimdController:
+    """
+    Class AimdController limits the number of requests in flight with additive increase / multiplicative decrease:
+    the limit grows by about one per window of healthy responses (faster than latency_target), and is cut by
+    decrease on a throttled or failed request, at most once per cooldown seconds.
+    """
+
+    def __init__(self, initial, minimum, maximum, latency_target, decrease=0.5, cooldown=1.0):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.latency_target = latency_target
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._cut_at = 0
+        import gevent.event
+        self._released = gevent.event.Event()
+
+    def acquire(self):
+        """
+        Waits until a request may start.
+        """
+        while self.in_flight >= int(self.limit):
+            self._released.clear()
+            self._released.wait()
+        self.in_flight += 1
+
+    def release(self):
+        """
+        Marks a request as done.
+        """
+        self.in_flight -= 1
+        self._released.set()
+
+    def on_success(self, latency):
+        """
+        Raises the limit after a healthy response.
+        """
+        if latency <= self.latency_target:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            metrics.set('fetch_concurrency_limit', self.limit)
+
+    def on_congestion(self):
+        """
+        Cuts the limit after a throttled, failed or timed out request.
+        """
+        now = time.monotonic()
+        if now - self._cut_at >= self.cooldown:
+            self._cut_at = now
+            self.limit = max(self.minimum, self.limit * self.decrease)
+            metrics.set('fetch_concurrency_limit', self.limit)
+            metrics.inc('fetch_concurrency_cuts_total')
+            logger.info("Fetch concurrency cut to %d", int(self.limit))
+
+
+class SessionEngine:
+    """
+    Class SessionEngine fetches web pages with gevent through one shared requests Session.
+    The session keeps persistent connections to every host, and the number of concurrent requests to a host is
+    limited to per_host_limit. The number of requests in flight is adapted by an AimdController, and throttled
+    (429, 5xx) or failed requests are retried up to retries times after a back-off that honours Retry-After.
+    The urls that failed after every retry are kept in failed_urls.
+    """
+
+    def __init__(self, user_agent, timeout, concurrency, per_host_limit, max_concurrency=None, min_concurrency=1,
+                 latency_target=2.0, retries=3, backoff_base=1.0, backoff_max=60.0):
+        self.timeout = timeout
+        self.concurrency = max_concurrency or concurrency
+        self.per_host_limit = per_host_limit
+        self.controller = AimdController(concurrency, min_concurrency, self.concurrency, latency_target)
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.failed_urls = []
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=per_host_limit)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({'User-agent': user_agent, 'Accept-Encoding': ACCEPT_ENCODING})
+        self._host_locks = {}
+
+    def _host_lock(self, url):
+        """
+        Returns the semaphore limiting the concurrent requests to the host of the url.
+        """
+        host = urlsplit(url).netloc
+        if host not in self._host_locks:
+            import gevent.lock
+            self._host_locks[host] = gevent.lock.BoundedSemaphore(self.per_host_limit)
+        return self._host_locks[host]
+
+    def _fetch(self, url):
+        """
+        Returns the response of one request to the url and its latency, with None for a failed request.
+        """
+        self.controller.acquire()
+        try:
+            with self._host_lock(url):
+                start = time.perf_counter()
+                try:
+                    response = self.session.get(url, timeout=self.timeout)
+                except requests.RequestException as err:
+                    logger.warning("error getting response from %s: %s", url, err)
+                    response = None
+                latency = time.perf_counter() - start
+        finally:
+            self.controller.release()
+        record_fetch(response, latency)
+        return response, latency
+
+    def get(self, url):
+        """
+        Returns the response of the url, retrying throttled and failed requests.
+        Returns the last response (or None if the request failed) after retries failed attempts.
+        """
+        import gevent
+        for attempt in range(self.retries + 1):
+            response, latency = self._fetch(url)
+            if response is not None and response.status_code not in RETRY_STATUSES:
+                self.controller.on_success(latency)
+                return response
+            self.controller.on_congestion()
+            if attempt < self.retries:
+                metrics.inc('http_retries_total')
+                gevent.sleep(backoff_time(attempt, response, self.backoff_base, self.backoff_max))
+        status = response.status_code if response is not None else 'no response'
+        logger.error("giving up on %s after %d attempts (%s)", url, self.retries + 1, status)
+        metrics.inc('http_gave_up_total')
+        self.failed_urls.append(url)
+        return response
+
+    def map(self, urls):
+        """
+        Returns the responses of the urls in the same order, with None for the failed requests.
+        """
+        import gevent.pool
+        pool = gevent.pool.Pool(self.concurrency)
+        return pool.map(self.get, urls)
+
+    def imap(self, urls):
+        """
+        Yields the responses of the urls as they arrive, skipping the failed requests (kept in failed_urls).
+        """
+        import gevent.pool
+        pool = gevent.pool.Pool(self.concurrency)
+        for response in pool.imap_unordered(self.get, urls):
+            if response is not None:
+                yield response
+
+
+class GrequestsEngine:
+    """
+    Class GrequestsEngine fetches web pages with a new grequests request (and connection) per url.
+    """
+
+    def __init__(self, user_agent, timeout, concurrency):
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.headers = {'User-agent': user_agent}
+        self.failed_urls = []
+
+    def get(self, url):
+        """
+        Returns the response of the url, or None if the request failed.
+        """
+        return self.map([url])[0]
+
+    def map(self, urls):
+        """
+        Returns the responses of the urls in the same order, with None for the failed requests.
+        """
+        import grequests  # monkey patches the process when imported, so only for this engine
+        request = [grequests.get(url, headers=self.headers, timeout=self.timeout) for url in urls]
+        responses = grequests.map(request, size=self.concurrency)
+        for url, response in zip(urls, responses):
+            record_fetch(response, response.elapsed.total_seconds() if response is not None else 0)
+            if response is None:
+                logger.error("no response from %s", url)
+                self.failed_urls.append(url)
+        return responses
+
+    def imap(self, urls):
+        """
+        Yields the responses of the urls as they arrive, skipping the failed requests.
+        """
+        def failed(request, err):
+            logger.error("no response from %s: %s", request.url, err)
+            record_fetch(None, 0)
+            self.failed_urls.append(request.url)
+
+        import grequests
+        rs = (grequests.get(url, headers=self.headers, timeout=self.timeout) for url in urls)
+        for response in grequests.imap(rs, size=self.concurrency, exception_handler=failed):
+            record_fetch(response, response.elapsed.total_seconds())
+            yield response
+
+
+def make_engine(config):
+    """
+    Returns the fetch engine selected by the FETCH section of the conf file.
+    """
+    fetch_config = config["FETCH"]
+    if fetch_config["engine"] == "grequests":
+        return GrequestsEngine(config["HEADERS"], config["TIMEOUT"], config["BATCH_SIZE"])
+    if fetch_config["engine"] == "session":
+        return SessionEngine(config["HEADERS"], config["TIMEOUT"], config["BATCH_SIZE"],
+                             fetch_config["per_host_limit"], fetch_config["max_concurrency"],
+                             fetch_config["min_concurrency"], fetch_config["latency_target"], fetch_config["retries"],
+                             fetch_config["backoff_base"], fetch_config["backoff_max"])
+    raise ValueError(f"Unknown fetch engine: {fetch_config['engine']}")
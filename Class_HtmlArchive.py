@@ -0,0 +1,110 @@
+import gzip
+import hashlib
+import os
+import sqlite3
+import time
+
+try:
+    import zstandard
+    EXTENSION = ".zst"
+except ImportError:
+    zstandard = None
+    EXTENSION = ".gz"
+
+
+def compress(content):
+    """
+    Returns the content compressed with zstd when it is installed, else with gzip.
+    """
+    if zstandard is not None:
+        return zstandard.ZstdCompressor().compress(content)
+    return gzip.compress(content)
+
+
+def load_page(directory, digest):
+    """
+    Returns the content of an archived page from its digest, or None if it is not in the archive.
+    Can run in a worker process, it only reads the objects folder.
+    """
+    path = os.path.join(directory, "objects", digest[:2], digest)
+    if os.path.exists(path + ".zst"):
+        with open(path + ".zst", 'rb') as file:
+            return zstandard.ZstdDecompressor().decompress(file.read())
+    if os.path.exists(path + ".gz"):
+        with gzip.open(path + ".gz", 'rb') as file:
+            return file.read()
+    return None
+
+
+def page_exists(directory, digest):
+    """
+    Returns True if a page with the digest is in the archive, compressed with zstd or gzip, without reading it.
+    """
+    path = os.path.join(directory, "objects", digest[:2], digest)
+    return os.path.exists(path + ".zst") or os.path.exists(path + ".gz")
+
+
+class HtmlArchive:
+    """
+    Class HtmlArchive stores the fetched pages compressed in a content-addressed folder
+    (objects/<digest[:2]>/<sha256 digest>), with an on-disk sqlite index of url -> digest.
+    Identical pages are stored once.
+    """
+
+    COMMIT_EVERY = 100
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(os.path.join(directory, "objects"), exist_ok=True)
+        self.index = sqlite3.connect(os.path.join(directory, "index.sqlite"))
+        self.index.execute("CREATE TABLE IF NOT EXISTS pages (url TEXT PRIMARY KEY, kind TEXT, digest TEXT, "
+                           "fetched_at REAL)")
+        self.index.execute("CREATE INDEX IF NOT EXISTS pages_kind ON pages (kind)")
+        self._uncommitted = 0
+
+    def put(self, url, kind, content):
+        """
+        Stores the content of a page fetched from the url, kind being 'listing' or 'article'.
+        Returns the digest of the content.
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        folder = os.path.join(self.directory, "objects", digest[:2])
+        path = os.path.join(folder, digest + EXTENSION)
+        if not page_exists(self.directory, digest):
+            os.makedirs(folder, exist_ok=True)
+            with open(f"{path}.tmp", 'wb') as file:
+                file.write(compress(content))
+            os.replace(f"{path}.tmp", path)
+        self.index.execute("INSERT OR REPLACE INTO pages (url, kind, digest, fetched_at) VALUES (?, ?, ?, ?)",
+                           (url, kind, digest, time.time()))
+        self._uncommitted += 1
+        if self._uncommitted >= self.COMMIT_EVERY:
+            self.commit()
+        return digest
+
+    def get(self, url):
+        """
+        Returns the content of the page archived for the url, or None if it was never archived.
+        """
+        result = self.index.execute("SELECT digest FROM pages WHERE url = ?", (url,)).fetchone()
+        return load_page(self.directory, result[0]) if result else None
+
+    def pages(self, kind):
+        """
+        Returns a list of (url, digest) of the archived pages of a kind.
+        """
+        return self.index.execute("SELECT url, digest FROM pages WHERE kind = ? ORDER BY url", (kind,)).fetchall()
+
+    def commit(self):
+        """
+        Writes the index changes to disk.
+        """
+        self.index.commit()
+        self._uncommitted = 0
+
+    def close(self):
+        """
+        Writes the index changes to disk and closes the index.
+        """
+        self.commit()
+        self.index.close()
@@ -0,0 +1,50 @@
+from collections import OrderedDict
+
+
+class IdCache:
+    """
+    Class IdCache holds a bounded name -> id mapping for one of the dimension tables (Authors, Tags, Stocks).
+    The least recently used names are evicted once the cache is full.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._ids = OrderedDict()
+
+    def get(self, name):
+        """
+        Returns the id of the name, or None if it is not cached.
+        """
+        if name in self._ids:
+            self._ids.move_to_end(name)
+            self.hits += 1
+            return self._ids[name]
+        self.misses += 1
+        return None
+
+    def put(self, name, id_num):
+        """
+        Adds the name and its id to the cache, evicting the least recently used names if needed.
+        """
+        self._ids[name] = id_num
+        self._ids.move_to_end(name)
+        while len(self._ids) > self.max_size:
+            self._ids.popitem(last=False)
+
+    def clear(self):
+        """
+        Removes every cached name, keeping the hit and miss counts.
+        """
+        self._ids.clear()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __str__(self):
+        """
+        Returns a string representation of the cache statistics.
+        """
+        message = f"Size: {len(self)}/{self.max_size}, Hits: {self.hits}, Misses: {self.misses}"
+        return message
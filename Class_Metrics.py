@@ -0,0 +1,174 @@
+import bisect
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _label_key(labels):
+    """
+    Returns a hashable key of a dict of labels.
+    """
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _label_text(key, extra=()):
+    """
+    Returns the Prometheus text of a label key, e.g. {status="200"}.
+    """
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in pairs) + "}"
+
+
+def peak_rss_mb():
+    """
+    Returns the peak resident set size of the process so far, in MB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB on Linux
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def current_rss_mb():
+    """
+    Returns the current resident set size of the process in MB, or the peak where /proc is not available.
+    """
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except OSError:
+        return peak_rss_mb()
+
+
+class Metrics:
+    """
+    Class Metrics holds labelled counters, gauges and latency histograms of the scraper stages.
+    They can be served in the Prometheus text format over HTTP or dumped to a json file.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+        self._server = None
+
+    def inc(self, name, amount=1, **labels):
+        """
+        Adds amount to the counter name with the given labels.
+        """
+        key = (name, _label_key(labels))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def set(self, name, value, **labels):
+        """
+        Sets the gauge name with the given labels to value.
+        """
+        with self._lock:
+            self.gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, value, **labels):
+        """
+        Records a value (in seconds) in the histogram name with the given labels.
+        """
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            histogram['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            histogram['sum'] += value
+            histogram['count'] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        """
+        Records the time spent in the with block in the histogram name.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self):
+        """
+        Returns a json serializable dict of the counters, gauges and histograms.
+        """
+        with self._lock:
+            counters = [{'name': name, 'labels': dict(key), 'value': value}
+                        for (name, key), value in sorted(self.counters.items())]
+            gauges = [{'name': name, 'labels': dict(key), 'value': value}
+                      for (name, key), value in sorted(self.gauges.items())]
+            histograms = [{'name': name, 'labels': dict(key), 'count': histogram['count'], 'sum': histogram['sum'],
+                           'buckets': dict(zip([str(bound) for bound in self.buckets] + ['+Inf'],
+                                               histogram['counts']))}
+                          for (name, key), histogram in sorted(self.histograms.items())]
+        return {'counters': counters, 'gauges': gauges, 'histograms': histograms}
+
+    def prometheus_text(self):
+        """
+        Returns the counters, gauges and histograms in the Prometheus text exposition format.
+        """
+        lines = []
+        with self._lock:
+            for kind, values in (('counter', self.counters), ('gauge', self.gauges)):
+                for name in sorted({name for name, _ in values}):
+                    lines.append(f"# TYPE {name} {kind}")
+                    lines += [f"{name}{_label_text(key)} {value}"
+                              for (metric, key), value in sorted(values.items()) if metric == name]
+            for name in sorted({name for name, _ in self.histograms}):
+                lines.append(f"# TYPE {name} histogram")
+                for (histogram_name, key), histogram in sorted(self.histograms.items()):
+                    if histogram_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip([str(bound) for bound in self.buckets] + ['+Inf'], histogram['counts']):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_label_text(key, [('le', bound)])} {cumulative}")
+                    lines.append(f"{name}_sum{_label_text(key)} {histogram['sum']}")
+                    lines.append(f"{name}_count{_label_text(key)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port):
+        """
+        Serves the metrics in the Prometheus text format on http://<host>:port/metrics from a background thread.
+        """
+        import http.server
+        metrics = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = metrics.prometheus_text().encode('utf-8')
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = http.server.ThreadingHTTPServer(("", port), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def dump(self, path):
+        """
+        Writes the counters, gauges and histograms to a json file.
+        """
+        with open(path, 'w') as file:
+            json.dump(self.snapshot(), file, indent=2)
+
+
+# the metrics shared by all the modules of the scraper
+metrics = Metrics()
@@ -0,0 +1,111 @@
+import json
+import os
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Class TokenBucket allows capacity calls per period seconds, refilling continuously.
+    """
+
+    def __init__(self, capacity, period):
+        self.capacity = capacity
+        self.rate = capacity / period
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """
+        Returns the number of seconds until a token is available (0 if one is available now).
+        """
+        self._refill(time.monotonic())
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        """
+        Takes a token, the caller has to check wait_time first.
+        """
+        self.tokens -= 1
+
+    def drain(self):
+        """
+        Empties the bucket.
+        """
+        self._refill(time.monotonic())
+        self.tokens = 0
+
+    def spent(self):
+        """
+        Returns the number of tokens spent (capacity minus the tokens left) as of now.
+        """
+        self._refill(time.monotonic())
+        return self.capacity - self.tokens
+
+    def restore(self, spent, saved_at):
+        """
+        Sets the bucket to the spent tokens saved at the saved_at wall clock timestamp, refilled since then.
+        """
+        self.tokens = min(self.capacity, self.capacity - spent + max(0, time.time() - saved_at) * self.rate)
+        self.updated = time.monotonic()
+
+
+class KeyRateLimiter:
+    """
+    Class KeyRateLimiter holds the per-minute and per-day token buckets of one API key, and a pause set when the
+    API reports that the key is throttled.
+    With a state_file, the calls spent from the per-day bucket are saved after every call and restored by the next
+    run, so a new process does not start with a full daily quota.
+    """
+
+    def __init__(self, per_minute, per_day, state_file=None):
+        self.minute_bucket = TokenBucket(per_minute, 60)
+        self.day_bucket = TokenBucket(per_day, 24 * 60 * 60)
+        self.paused_until = 0
+        self.calls = 0
+        self.state_file = state_file
+        self._lock = threading.Lock()
+        if state_file and os.path.exists(state_file):
+            with open(state_file) as file:
+                state = json.load(file)
+            self.day_bucket.restore(state['day_spent'], state['saved_at'])
+
+    def _save_state(self):
+        """
+        Writes the calls spent from the per-day bucket and the time to the state file, replacing it atomically.
+        """
+        tmp_path = f"{self.state_file}.tmp"
+        with open(tmp_path, 'w') as file:
+            json.dump({'day_spent': self.day_bucket.spent(), 'saved_at': time.time()}, file)
+        os.replace(tmp_path, self.state_file)
+
+    def acquire(self):
+        """
+        Blocks until the key may make a call and takes its tokens.
+        Returns False without blocking if the daily quota of the key is spent.
+        """
+        while True:
+            with self._lock:
+                if self.day_bucket.wait_time() > 0:
+                    return False
+                wait = max(self.minute_bucket.wait_time(), self.paused_until - time.monotonic())
+                if wait <= 0:
+                    self.minute_bucket.take()
+                    self.day_bucket.take()
+                    self.calls += 1
+                    if self.state_file:
+                        self._save_state()
+                    return True
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """
+        Stops the key from making calls for the given number of seconds, and empties its per-minute bucket.
+        """
+        with self._lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.minute_bucket.drain()
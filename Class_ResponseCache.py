@@ -0,0 +1,83 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+import time
+
+
+class ResponseCache:
+    """
+    Class ResponseCache keeps json API responses on disk, gzip compressed, one file per key.
+    Every entry has its own expiry time, and the least recently used entries are evicted once the files take more
+    than max_bytes.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.size = sum(entry.stat().st_size for entry in os.scandir(directory) if entry.name.endswith('.json.gz'))
+
+    def _path(self, key):
+        """
+        Returns the file path of the entry of the key.
+        """
+        return os.path.join(self.directory, f"{hashlib.sha1(key.encode('utf-8')).hexdigest()}.json.gz")
+
+    def get(self, key, ignore_expiry=False):
+        """
+        Returns the cached response of the key, or None if it is not cached or has expired.
+        With ignore_expiry, an expired response is returned as well (to replay the cache offline).
+        """
+        path = self._path(key)
+        try:
+            with gzip.open(path, 'rt', encoding='utf-8') as file:
+                entry = json.load(file)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        if entry['expires'] < time.time() and not ignore_expiry:
+            self.misses += 1
+            return None
+        os.utime(path)  # marks the entry as recently used
+        self.hits += 1
+        return entry['response']
+
+    def put(self, key, response, expires):
+        """
+        Caches the response of the key until the expires timestamp, evicting old entries if needed.
+        """
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp_path, 'wt', encoding='utf-8') as file:
+            json.dump({'key': key, 'expires': expires, 'response': response}, file)
+        with self._lock:
+            if os.path.exists(path):
+                self.size -= os.path.getsize(path)
+            os.replace(tmp_path, path)
+            self.size += os.path.getsize(path)
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        """
+        Deletes the least recently used entries until the cache fits in max_bytes.
+        """
+        entries = sorted((entry for entry in os.scandir(self.directory) if entry.name.endswith('.json.gz')),
+                         key=lambda entry: entry.stat().st_mtime)
+        for entry in entries:
+            if self.size <= self.max_bytes:
+                break
+            self.size -= entry.stat().st_size
+            os.remove(entry.path)
+
+    def __str__(self):
+        """
+        Returns a string representation of the cache statistics.
+        """
+        message = f"Size: {self.size} bytes, Hits: {self.hits}, Misses: {self.misses}"
+        return message
@@ -0,0 +1,191 @@
+import argparse
+import os
+import time
+import numpy as np
+import pymysql.cursors
+from NASDAQ_config import config, get_logger, setup_logging
+
+logger = get_logger("NASDAQ_analytics")
+
+# articles published from this hour (New York time) on are priced from the close of their day
+MARKET_CLOSE_HOUR = 16
+FETCH_ROWS = 100000
+
+
+def _fetch_columns(connection, sql, params, dtypes):
+    """
+    Runs a query with an unbuffered cursor and returns its columns as NumPy arrays of the given dtypes,
+    converting FETCH_ROWS rows at a time instead of building a dict per row.
+    """
+    chunks = [[] for _ in dtypes]
+    cursor = connection.cursor(pymysql.cursors.SSCursor)
+    try:
+        cursor.execute(sql, params)
+        rows = cursor.fetchmany(FETCH_ROWS)
+        while rows:
+            for chunk, column, dtype in zip(chunks, zip(*rows), dtypes):
+                chunk.append(np.array(column, dtype=dtype))
+            rows = cursor.fetchmany(FETCH_ROWS)
+    finally:
+        cursor.close()
+    return [np.concatenate(chunk) if chunk else np.array([], dtype=dtype) for chunk, dtype in zip(chunks, dtypes)]
+
+
+def load_links(connection, after_article_id=0):
+    """
+    Returns the article_id, stock_id and published_date arrays of the article-ticker links of the dated articles
+    whose article_id is greater than after_article_id.
+    """
+    return _fetch_columns(connection,
+                          "SELECT sa.article_id, sa.stock_id, a.published_date FROM Stock_Articles sa "
+                          "JOIN Articles a ON a.article_id = sa.article_id "
+                          "WHERE a.published_date IS NOT NULL AND sa.article_id > %s",
+                          (after_article_id,), (np.int64, np.int64, 'datetime64[s]'))
+
+
+def load_prices(connection, stock_ids=None):
+    """
+    Returns the stock_id, day and close arrays of the daily prices, sorted by stock and day.
+    Loads every stock, or only the stock_ids given.
+    """
+    sql = "SELECT stock_id, date, close FROM Stocks_Prices WHERE close IS NOT NULL"
+    dtypes = (np.int64, 'datetime64[D]', np.float64)
+    if stock_ids is None:
+        return _fetch_columns(connection, sql + " ORDER BY stock_id, date", (), dtypes)
+    columns = [[], [], []]
+    stock_ids = np.unique(stock_ids).tolist()
+    for start in range(0, len(stock_ids), config["SELECT_CHUNK"]):
+        chunk = stock_ids[start:start + config["SELECT_CHUNK"]]
+        placeholders = ", ".join(["%s"] * len(chunk))
+        for column, values in zip(columns, _fetch_columns(
+                connection, f"{sql} AND stock_id IN ({placeholders}) ORDER BY stock_id, date", chunk, dtypes)):
+            column.append(values)
+    return [np.concatenate(column) if column else np.array([], dtype=dtype) for column, dtype in zip(columns, dtypes)]
+
+
+def forward_returns(link_stock, link_published, price_stock, price_day, price_close, windows):
+    """
+    Returns an array (links x windows) of the forward returns of every link: the close w trading days after the
+    last close before the article was published, divided by that close, minus 1. NaN when the stock has no price
+    before the article or not w trading days after it yet. Also returns the base day of every link.
+    The prices must be sorted by stock and day; every link is placed in them with one searchsorted.
+    """
+    count = len(price_stock)
+    price_keys = (price_stock << 32) + price_day.astype(np.int64)
+    published_day = link_published.astype('datetime64[D]')
+    after_close = (link_published - published_day) >= np.timedelta64(MARKET_CLOSE_HOUR, 'h')
+    # the first day whose close can react to the article
+    reaction_day = published_day.astype(np.int64) + after_close
+    base = np.searchsorted(price_keys, (link_stock << 32) + reaction_day, side='left') - 1
+    base_valid = base >= 0
+    base_valid[base_valid] = price_stock[base[base_valid]] == link_stock[base_valid]
+    returns = np.full((len(link_stock), len(windows)), np.nan)
+    for column, window in enumerate(windows):
+        end = base + window
+        valid = base_valid & (end < count)
+        valid[valid] = price_stock[end[valid]] == link_stock[valid]
+        returns[valid, column] = price_close[end[valid]] / price_close[base[valid]] - 1
+    base_day = np.full(len(link_stock), np.datetime64('NaT'), dtype='datetime64[D]')
+    base_day[base_valid] = price_day[base[base_valid]]
+    return returns, base_day
+
+
+def _load_cache(cache_file, windows):
+    """
+    Returns the arrays saved in the cache file, or None if there is none or it was computed for other windows.
+    """
+    if not cache_file or not os.path.exists(cache_file):
+        return None
+    cache = dict(np.load(cache_file))
+    if cache['windows'].tolist() != list(windows):
+        logger.info('The analytics cache was computed for windows %s, recomputing', cache['windows'].tolist())
+        return None
+    return cache
+
+
+def _save_cache(cache_file, arrays):
+    """
+    Writes the arrays to the cache file atomically.
+    """
+    with open(f"{cache_file}.tmp", 'wb') as file:
+        np.savez(file, **arrays)
+    os.replace(f"{cache_file}.tmp", cache_file)
+
+
+def compute_forward_returns(connection, windows=None, cache_file=None):
+    """
+    Returns a DataFrame with the forward returns of every article-ticker link (columns article_id, stock_id,
+    published_date, base_date, return_<w>d for every window of trading days).
+    The results are cached in cache_file: only the links of new articles, and the cached links whose returns were
+    not complete yet (missing prices), are computed again, with the prices of their stocks only.
+    """
+    import pandas as pd
+    windows = list(windows or config["ANALYTICS"]["windows"])
+    if cache_file is None:
+        cache_file = config["ANALYTICS"]["cache_file"]
+    start = time.perf_counter()
+    cache = _load_cache(cache_file, windows)
+    if cache is None:
+        article_id, stock_id, published = load_links(connection)
+        prices = load_prices(connection)
+        kept = None
+    else:
+        complete = ~np.isnan(cache['returns']).any(axis=1)
+        kept = {name: cache[name][complete] for name in ('article_id', 'stock_id', 'published', 'base_day', 'returns')}
+        new_article_id, new_stock_id, new_published = load_links(connection, int(cache['max_article_id']))
+        article_id = np.concatenate([cache['article_id'][~complete], new_article_id])
+        stock_id = np.concatenate([cache['stock_id'][~complete], new_stock_id])
+        published = np.concatenate([cache['published'][~complete], new_published])
+        prices = load_prices(connection, stock_id)
+    returns, base_day = forward_returns(stock_id, published, *prices, windows)
+    arrays = {'article_id': article_id, 'stock_id': stock_id, 'published': published, 'base_day': base_day,
+              'returns': returns}
+    if kept is not None:
+        arrays = {name: np.concatenate([kept[name], values]) for name, values in arrays.items()}
+    max_article_id = max(int(arrays['article_id'].max()) if len(arrays['article_id']) else 0,
+                         int(cache['max_article_id']) if cache is not None else 0)
+    if cache_file:
+        _save_cache(cache_file, {**arrays, 'windows': np.array(windows), 'max_article_id': np.array(max_article_id)})
+    logger.info('Computed the forward returns of %d links (%d cached) in %.2f seconds', len(article_id),
+                len(arrays['article_id']) - len(article_id), time.perf_counter() - start)
+
+    result = pd.DataFrame({'article_id': arrays['article_id'], 'stock_id': arrays['stock_id'],
+                           'published_date': arrays['published'], 'base_date': arrays['base_day']})
+    for column, window in enumerate(windows):
+        result[f'return_{window}d'] = arrays['returns'][:, column]
+    return result
+
+
+def parse():
+    """
+    parsing arguments from command line
+    """
+    parser = argparse.ArgumentParser(prog='NASDAQ_analytics',
+                                     description='stock price reaction to the scraped NASDAQ articles',
+                                     epilog='for further information please see README.md file')
+    parser.add_argument('--windows', type=lambda value: [int(window) for window in value.split(',')],
+                        default=config["ANALYTICS"]["windows"],
+                        help="forward return windows in trading days, e.g. 1,5,20")
+    parser.add_argument('--output', help="write the forward returns of every article and ticker to a csv file")
+    parser.add_argument('--no_cache', action='store_true', help="compute everything again and do not cache it")
+    return parser.parse_args()
+
+
+def main():
+    setup_logging("NASDAQ_analytics")
+    args = parse()
+    connection = pymysql.connect(host=config["HOST"],
+                                 user=config["USER"],
+                                 password=config["PASSWORD"],
+                                 database=config["DB"],
+                                 cursorclass=pymysql.cursors.DictCursor)
+    start = time.perf_counter()
+    result = compute_forward_returns(connection, args.windows, "" if args.no_cache else None)
+    print(f'Forward returns of {len(result)} article-ticker links in {time.perf_counter() - start:.2f} seconds')
+    print(result.filter(like='return_').describe().to_string())
+    if args.output:
+        result.to_csv(args.output, index=False)
+
+
+if __name__ == "__main__":
+    main()
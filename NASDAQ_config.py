@@ -0,0 +1,39 @@
+import json
+import logging
+import os
+
+CONFIG_FILE = "conf.json"
+LOG_DIR = "logs"
+LOG_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+# read once per process, shared by every module
+with open(CONFIG_FILE) as f:
+    config = json.load(f)
+
+
+def get_logger(name):
+    """
+    Returns the logger of a module. It writes nothing until the program entry point calls setup_logging, so
+    importing a module as a library never opens or truncates a log file.
+    """
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        logger.addHandler(logging.NullHandler())
+    return logger
+
+
+def setup_logging(*names, mode="w"):
+    """
+    Sends the records of the named loggers to logs/<name>.log at the LOG_LEVEL of the conf file.
+    A logger that already writes to a file is left as it is, so each log file is opened once per process.
+    """
+    os.makedirs(LOG_DIR, exist_ok=True)
+    formatter = logging.Formatter(LOG_FORMAT)
+    for name in names:
+        logger = logging.getLogger(name)
+        logger.setLevel(config["LOG_LEVEL"])
+        if any(isinstance(handler, logging.FileHandler) for handler in logger.handlers):
+            continue
+        handler = logging.FileHandler(os.path.join(LOG_DIR, f"{name}.log"), mode=mode)
+        handler.setFormatter(formatter)
+        logger.addHandler(handler)
@@ -1,24 +1,36 @@
-import logging
+import hashlib
 import json
-import dateparser
+import os
+import time
+import pymysql
+from Class_BloomFilter import BloomFilter
+from Class_DateParser import date_parser
+from Class_IdCache import IdCache
+from Class_Metrics import metrics
+from NASDAQ_config import config, get_logger
 
+logger = get_logger("NASDAQ_datacollector")
 
-with open("conf.json") as f:
-    config = json.load(f)
+# name -> id caches of the dimension tables, keyed by table name
+DIMENSIONS = {"Authors": ("author_id", "author_name"),
+              "Tags": ("tag_id", "tag_name"),
+              "Stocks": ("stock_id", "stock_tick")}
+id_caches = {table: IdCache(config["ID_CACHE_SIZE"]) for table in DIMENSIONS}
 
-# logging config
+# MySQL errors of migration statements whose change is already in the database:
+# table exists, duplicate column name, duplicate key name
+ALREADY_APPLIED_ERRORS = (1050, 1060, 1061)
 
-logger = logging.getLogger("NASDAQ_datacollector")
-logger.setLevel(logging.INFO)
-handler = logging.FileHandler("logs/NASDAQ_datacollector.log", mode="w")
-formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-handler.setFormatter(formatter)
-logger.addHandler(handler)
+# on-disk Bloom filter of the url hashes in Articles, loaded by load_url_filter when URL_BLOOM file is set
+url_filter = None
+# highest article_id read from the Articles table into the url filter, saved next to it
+url_filter_article_id = 0
 
 
 def create_database(database_create_code, connection):
     """
-    Creates a database for the NASDAQ articles according to the NASDAQ_sql_schema.sql file.
+    Creates a database for the NASDAQ articles according to the NASDAQ_sql_schema.sql file and brings it up to date
+    with the migrations in the MIGRATIONS_DIR folder.
     """
     try:
         cursor = connection.cursor()
@@ -29,155 +41,378 @@ def create_database(database_create_code, connection):
             for query in queries[:-1]:
                 cursor.execute(query)
         connection.commit()
+        apply_migrations(config["MIGRATIONS_DIR"], connection)
         logger.info('Database was created')
 
     except FileNotFoundError as er:
         print(f'{er} Please make sure the sql file exist')
 
 
-def add_author_to_database(author_name, connection):
+def _sql_statements(sql_file):
     """
-    Gets author name and adds it to the database.
-    Returns the authors_id.
+    Returns the statements of a sql file, without the comment-only chunks.
+    """
+    with open(sql_file, 'r') as file:
+        queries = file.read().split(';')
+    statements = []
+    for query in queries:
+        code = [line for line in query.splitlines() if line.strip() and not line.strip().startswith('--')]
+        if code:
+            statements.append(query)
+    return statements
+
+
+def current_schema_version(connection):
+    """
+    Returns the version of the last migration applied to the database (0 if none was).
     """
     cursor = connection.cursor()
-    cursor.execute("SELECT author_id FROM Authors WHERE author_name = %s", (author_name,))
+    cursor.execute("SELECT MAX(version) AS version FROM Schema_Version")
     result = cursor.fetchone()
-    if result:
-        return result['author_id']
-    else:
-        cursor.execute("INSERT INTO Authors (author_name) VALUES (%s)", (author_name,))
-        connection.commit()
-        cursor.execute("SELECT author_id FROM Authors WHERE author_name = %s ", (author_name,))
-        author_id = cursor.fetchone()['author_id']
+    return result['version'] or 0
+
+
+def apply_migrations(migrations_dir, connection):
+    """
+    Applies the migrations in migrations_dir (files named <version>_<name>.sql) that are newer than the database
+    schema version, in order, and records every applied version in Schema_Version.
+    Changes that are already in the database (an existing column, key or table) are skipped, so a migration that
+    was interrupted can be applied again.
+    """
+    version = current_schema_version(connection)
+    cursor = connection.cursor()
+    for file_name in sorted(os.listdir(migrations_dir)):
+        if not file_name.endswith('.sql'):
+            continue
+        file_version = int(file_name.split('_', 1)[0])
+        if file_version <= version:
+            continue
+        logger.info(f'Applying migration {file_name}')
+        for query in _sql_statements(os.path.join(migrations_dir, file_name)):
+            try:
+                cursor.execute(query)
+            except pymysql.MySQLError as err:
+                if err.args[0] not in ALREADY_APPLIED_ERRORS:
+                    raise
+                logger.info(f'Skipping a change already in the database: {err}')
+        cursor.execute("INSERT INTO Schema_Version (version) VALUES (%s)", (file_version,))
         connection.commit()
-        return author_id
+        version = file_version
+    logger.info(f'Database schema version: {version}')
+
+
+def url_hash(url):
+    """
+    Returns the hash the url is stored and looked up by (the same as MySQL SHA1(url)).
+    """
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
 
 
-def add_article_to_database(author_id, title, article_content, url, published_date, connection):
+def _chunks(items, size):
     """
-    Gets author author_id, title, article_content,url, date and adds them to the database.
-    Returns the article_id.
+    Yields consecutive slices of items with at most size elements each.
+    """
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def select_ids(table, id_column, name_column, names, connection):
+    """
+    Gets a list of names from one of the dimension tables (Authors, Tags, Stocks).
+    Returns a dict mapping each name stored exactly as given to its id. A name the column collation matches to a
+    differently spelled row (other case, accents or trailing spaces) is left out.
     """
     cursor = connection.cursor()
-    published_date = dateparser.parse(published_date)
-    sql = """
-          INSERT INTO Articles (author_id, title, article_content,url,
-          published_date) VALUES (%s, %s, %s, %s, %s)
-          """
-    cursor.execute(sql, (author_id, title, article_content, url, published_date))
-    connection.commit()
-    cursor.execute("SELECT article_id FROM Articles WHERE url = %s", (url,))
-    article_id = cursor.fetchone()['article_id']
-    return article_id
+    ids = {}
+    for chunk in _chunks(list(names), config["SELECT_CHUNK"]):
+        requested = set(chunk)
+        placeholders = ", ".join(["%s"] * len(chunk))
+        with metrics.timer('db_statement_seconds', statement='select', table=table):
+            cursor.execute(f"SELECT {id_column}, {name_column} FROM {table} WHERE {name_column} IN ({placeholders})",
+                           chunk)
+        for result in cursor.fetchall():
+            if result[name_column] in requested:
+                ids[result[name_column]] = result[id_column]
+    return ids
 
 
-def add_tickers_to_database(ticker_list, connection):
+def warm_id_caches(connection):
     """
-    Gets tickers list and adds them to the database.
-    Returns the list of ticks_ids.
+    Loads the most recent names of every dimension table into its id cache, one SELECT per table.
     """
-    logger.info(f'Adding {len(ticker_list)} tickers to the database')
     cursor = connection.cursor()
-    stock_ids = []
-    for tick in ticker_list:
-        cursor.execute("SELECT stock_id FROM Stocks WHERE stock_tick = %s", (tick,))
-        result = cursor.fetchone()
-        if result:
-            stock_ids.append(result['stock_id'])
-        else:
-            cursor.execute("INSERT INTO Stocks (stock_tick) VALUES (%s)", (tick,))
-            connection.commit()
-            cursor.execute("SELECT stock_id FROM Stocks WHERE stock_tick = %s", (tick,))
-            stock_ids.append(cursor.fetchone()['stock_id'])
+    for table, (id_column, name_column) in DIMENSIONS.items():
+        cache = id_caches[table]
+        cursor.execute(f"SELECT {id_column}, {name_column} FROM {table} ORDER BY {id_column} DESC LIMIT %s",
+                       (cache.max_size,))
+        for result in reversed(cursor.fetchall()):
+            cache.put(result[name_column], result[id_column])
+        logger.info(f'Loaded {len(cache)} {table} into the id cache')
 
-    return stock_ids
+
+def id_caches_summary():
+    """
+    Returns a string with the hit and miss counts of every dimension id cache.
+    """
+    return "\n".join(f"{table} id cache - {cache}" for table, cache in id_caches.items())
 
 
-def add_stock_articles_to_database(article_id, stock_ids, connection):
+def _upsert_name(table, id_column, name_column, name, connection):
     """
-    Gets stock_ids list, article_id and adds them to the database.
+    Upserts one name into one of the dimension tables and returns the id of its row, whichever row the unique key
+    of the column collation matched it to. Does not commit.
     """
     cursor = connection.cursor()
-    for stock_id in stock_ids:
-        cursor.execute("INSERT INTO Stock_Articles (stock_id, article_id) VALUES (%s, %s)",
-                       (stock_id, article_id))
-        connection.commit()
+    # LAST_INSERT_ID(id) makes the statement report the id of an existing row as well
+    with metrics.timer('db_statement_seconds', statement='upsert', table=table):
+        cursor.execute(f"INSERT INTO {table} ({name_column}) VALUES (%s) "
+                       f"ON DUPLICATE KEY UPDATE {id_column} = LAST_INSERT_ID({id_column})", (name,))
+    return cursor.lastrowid
 
 
-def add_tags_to_database(tag_list, connection):
+def add_names_to_database(table, id_column, name_column, names, connection):
     """
-    Gets tags list and adds them to the database.
-    Returns the list of tag_ids.
+    Gets a set of names for one of the dimension tables (Authors, Tags, Stocks) and upserts the ones that are not
+    in the table id cache. A single name costs one statement (LAST_INSERT_ID), several names a multi-row upsert and
+    one select; the names the select does not find spelled exactly as given are upserted one by one.
+    Returns a dict mapping every name to its id. Does not commit.
     """
-    cursor = connection.cursor()
-    tag_ids = []
-    for tag_name in tag_list:
-        cursor.execute("SELECT tag_id FROM Tags WHERE tag_name = %s", (tag_name,))
-        result = cursor.fetchone()
-        if result:
-            tag_ids.append(result['tag_id'])
+    names = set(names)
+    if not names:
+        return {}
+    cache = id_caches[table]
+    ids = {}
+    for name in names:
+        id_num = cache.get(name)
+        if id_num is not None:
+            ids[name] = id_num
+    # sorted so that concurrent workers lock the unique key entries in the same order and cannot deadlock
+    uncached = sorted(name for name in names if name not in ids)
+    if uncached:
+        if len(uncached) == 1:
+            found = {}
         else:
-            cursor.execute("INSERT INTO Tags (tag_name) VALUES (%s)", (tag_name,))
+            cursor = connection.cursor()
+            with metrics.timer('db_statement_seconds', statement='upsert', table=table):
+                cursor.executemany(f"INSERT INTO {table} ({name_column}) VALUES (%s) "
+                                   f"ON DUPLICATE KEY UPDATE {id_column} = {id_column}",
+                                   [(name,) for name in uncached])
+            found = select_ids(table, id_column, name_column, uncached, connection)
+        for name in uncached:
+            if name not in found:
+                found[name] = _upsert_name(table, id_column, name_column, name, connection)
+        for name, id_num in found.items():
+            cache.put(name, id_num)
+        ids.update(found)
+    return ids
+
+
+def add_articles_to_database(rows, author_ids, connection, overwrite=False):
+    """
+    Gets a list of article rows (Article.row_info() dicts with a parsed published_date) and the author
+    name -> author_id mapping and inserts all the articles with a single multi-row insert.
+    Articles already in the database (same url_hash) are skipped by the insert, or updated in place if overwrite.
+    Returns a dict mapping each article url to its article_id. Does not commit.
+    """
+    cursor = connection.cursor()
+    if overwrite:
+        sql = """
+              INSERT INTO Articles (author_id, title, article_content, url,
+              url_hash, published_date) VALUES (%s, %s, %s, %s, %s, %s)
+              ON DUPLICATE KEY UPDATE author_id = VALUES(author_id), title = VALUES(title),
+              article_content = VALUES(article_content), published_date = VALUES(published_date)
+              """
+    else:
+        sql = """
+              INSERT IGNORE INTO Articles (author_id, title, article_content, url,
+              url_hash, published_date) VALUES (%s, %s, %s, %s, %s, %s)
+              """
+    with metrics.timer('db_statement_seconds', statement='insert', table='Articles'):
+        cursor.executemany(sql, [(author_ids[row['author']], row['title'], row['article_content'], row['url'],
+                                  url_hash(row['url']), row['published_date']) for row in rows])
+    hashes = {url_hash(row['url']): row['url'] for row in rows}
+    article_ids = select_ids("Articles", "article_id", "url_hash", hashes, connection)
+    return {hashes[digest]: article_id for digest, article_id in article_ids.items()}
+
+
+def add_links_to_database(table, id_column, pairs, connection):
+    """
+    Gets a list of (id, article_id) pairs and inserts them into a link table (Stock_Articles, Article_Tags)
+    with a single multi-row insert. Pairs already in the table are skipped. Does not commit.
+    """
+    if pairs:
+        cursor = connection.cursor()
+        with metrics.timer('db_statement_seconds', statement='insert', table=table):
+            cursor.executemany(f"INSERT IGNORE INTO {table} ({id_column}, article_id) VALUES (%s, %s)", pairs)
+
+
+def remove_links_from_database(article_ids, connection):
+    """
+    Gets a list of article_ids and deletes their rows from the link tables (Stock_Articles, Article_Tags).
+    Does not commit.
+    """
+    cursor = connection.cursor()
+    for chunk in _chunks(list(article_ids), config["SELECT_CHUNK"]):
+        placeholders = ", ".join(["%s"] * len(chunk))
+        for table in ("Stock_Articles", "Article_Tags"):
+            with metrics.timer('db_statement_seconds', statement='delete', table=table):
+                cursor.execute(f"DELETE FROM {table} WHERE article_id IN ({placeholders})", chunk)
+
+
+def bulk_insert_articles(rows, connection, overwrite=False):
+    """
+    Gets a list of article rows (Article.row_info() dicts) and writes them to the database.
+    Every table is written once per batch and the batch is committed once.
+    If overwrite, articles already in the database are updated and their tags and tickers replaced, keeping their
+    article_id.
+    """
+    existing = select_ids("Articles", "article_id", "url_hash", [url_hash(row['url']) for row in rows], connection)
+    if overwrite:
+        rows = list({row['url']: row for row in rows}.values())
+    else:
+        # the articles already in the database are skipped, so their tags and tickers are not linked twice
+        rows = list({row['url']: row for row in rows if url_hash(row['url']) not in existing}.values())
+    if not rows:
+        logger.info('All the articles are already in the database')
+        return
+    for row in rows:
+        with metrics.timer('date_parse_seconds'):
+            row['published_date'] = date_parser.parse(row['date'])
+    batch_start = time.perf_counter()
+    try:
+        author_ids = add_names_to_database("Authors", *DIMENSIONS["Authors"],
+                                           (row['author'] for row in rows), connection)
+        article_ids = add_articles_to_database(rows, author_ids, connection, overwrite)
+        if overwrite and existing:
+            remove_links_from_database(existing.values(), connection)
+        stock_ids = add_names_to_database("Stocks", *DIMENSIONS["Stocks"],
+                                          (tick for row in rows for tick in row['tickers']), connection)
+        tag_ids = add_names_to_database("Tags", *DIMENSIONS["Tags"],
+                                        (tag for row in rows for tag in row['tags']), connection)
+
+        add_links_to_database("Stock_Articles", "stock_id",
+                              [(stock_ids[tick], article_ids[row['url']]) for row in rows for tick in row['tickers']],
+                              connection)
+        add_links_to_database("Article_Tags", "tag_id",
+                              [(tag_ids[tag], article_ids[row['url']]) for row in rows for tag in row['tags']],
+                              connection)
+        update_high_water_mark(rows, connection)
+        with metrics.timer('db_commit_seconds'):
             connection.commit()
-            cursor.execute("SELECT tag_id FROM Tags WHERE tag_name = %s", (tag_name,))
-            tag_ids.append(cursor.fetchone()['tag_id'])
-    return tag_ids
+    except Exception:
+        connection.rollback()
+        metrics.inc('db_rollbacks_total')
+        # ids inserted by the failed batch were rolled back with it
+        for cache in id_caches.values():
+            cache.clear()
+        raise
+    if url_filter is not None:
+        for row in rows:
+            url_filter.add(url_hash(row['url']))
+    metrics.observe('db_batch_seconds', time.perf_counter() - batch_start)
+    metrics.inc('db_articles_written_total', len(rows))
+    logger.info('%d articles were added to the database', len(article_ids))
 
 
-def add_article_tags_to_database(article_id, tag_ids, connection):
+def get_high_water_mark(connection):
     """
-    Gets tag_ids list, article_id and adds them to the database.
+    Returns a dict with the url and published_date of the newest article ingested, or None if there is none yet.
     """
     cursor = connection.cursor()
-    for tag_id in tag_ids:
-        cursor.execute("INSERT INTO Article_Tags (tag_id, article_id) VALUES (%s, %s)",
-                       (tag_id, article_id))
-        connection.commit()
+    cursor.execute("SELECT url, published_date FROM Crawl_State WHERE state_key = 'newest_article'")
+    return cursor.fetchone()
 
 
-def get_all_urls(connection):
+def update_high_water_mark(rows, connection):
     """
-    get a list of urls currently in the database.
+    Gets a list of article rows with a parsed published_date and records the newest one as the high-water mark,
+    unless a newer article was already recorded. Does not commit.
     """
-    logger.info("Getting url links")
-    url_list = []
+    dated = [row for row in rows if row['published_date']]
+    if not dated:
+        return
+    newest = max(dated, key=lambda row: row['published_date'].replace(tzinfo=None))
     cursor = connection.cursor()
-    cursor.execute("SELECT url FROM Articles")
-    query = cursor.fetchall()
-    if query:
-        for result in query:
-            url_list.append(result['url'])
-    logger.info(f"Found {len(url_list)} url links")
-    return url_list
+    # url has to be assigned first, MySQL evaluates the assignments left to right
+    with metrics.timer('db_statement_seconds', statement='upsert', table='Crawl_State'):
+        cursor.execute("INSERT INTO Crawl_State (state_key, url, published_date) VALUES ('newest_article', %s, %s) "
+                       "ON DUPLICATE KEY UPDATE "
+                       "url = IF(published_date IS NULL OR VALUES(published_date) > published_date, VALUES(url), url), "
+                       "published_date = IF(published_date IS NULL OR VALUES(published_date) > published_date, "
+                       "VALUES(published_date), published_date)",
+                       (newest['url'], newest['published_date']))
 
 
-def update_database(articles_list, connection):  # Function assumes database was created in the main program
+def load_url_filter(connection):
     """
-    Gets a list of article objects and updates the database with new information.
+    Loads the Bloom filter of the article url hashes from the URL_BLOOM file, or starts an empty one if the file does
+    not exist yet, and adds the articles stored after the highest article_id saved with it. A filter left stale by a
+    crash, a worker or an interrupted run is brought up to date this way. Does nothing when no file is configured.
     """
-    logger.info(f'Number of articles: {len(articles_list)}')
-    if articles_list and type(articles_list) == list:
-        for article in articles_list:
-            article_data_dict = article.row_info()
+    global url_filter, url_filter_article_id
+    bloom_config = config["URL_BLOOM"]
+    if not bloom_config["file"]:
+        return
+    url_filter_article_id = 0
+    if os.path.exists(bloom_config["file"]):
+        url_filter = BloomFilter.load(bloom_config["file"])
+        if os.path.exists(f'{bloom_config["file"]}.json'):
+            with open(f'{bloom_config["file"]}.json') as file:
+                url_filter_article_id = json.load(file)['max_article_id']
+        logger.info(f'Loaded the url filter from {bloom_config["file"]} up to article {url_filter_article_id}')
+    else:
+        url_filter = BloomFilter.for_capacity(bloom_config["capacity"], bloom_config["error_rate"])
+    # unbuffered, so only SELECT_CHUNK rows are held in memory at a time
+    cursor = connection.cursor(pymysql.cursors.SSCursor)
+    added = 0
+    try:
+        cursor.execute("SELECT article_id, url_hash FROM Articles WHERE article_id > %s", (url_filter_article_id,))
+        results = cursor.fetchmany(config["SELECT_CHUNK"])
+        while results:
+            for article_id, hash_value in results:
+                url_filter.add(hash_value)
+                url_filter_article_id = max(url_filter_article_id, article_id)
+            added += len(results)
+            results = cursor.fetchmany(config["SELECT_CHUNK"])
+    finally:
+        cursor.close()
+    logger.info(f'Added {added} articles from the Articles table to the url filter')
 
-            author_name = article_data_dict['author']
-            author_id = add_author_to_database(author_name=author_name, connection=connection)
 
-            title, article_content, url, published_date = article_data_dict['title'], \
-                article_data_dict['article_content'], article_data_dict['url'], article_data_dict['date']
-            article_id = add_article_to_database(author_id=author_id, title=title, article_content=article_content,
-                                                 url=url, published_date=published_date, connection=connection)
+def save_url_filter():
+    """
+    Writes the Bloom filter of the article url hashes to the URL_BLOOM file, and the highest article_id it was
+    loaded up to next to it. The articles added during the run are read again on the next load, so a filter saved
+    by any run, complete or not, is never missing a stored url.
+    """
+    if url_filter is None:
+        return
+    url_filter.save(config["URL_BLOOM"]["file"])
+    path = f'{config["URL_BLOOM"]["file"]}.json'
+    with open(f"{path}.tmp", 'w') as file:
+        json.dump({'max_article_id': url_filter_article_id}, file)
+    os.replace(f"{path}.tmp", path)
 
-            tickers = article_data_dict['tickers']
-            stock_ids = add_tickers_to_database(ticker_list=tickers, connection=connection)
 
-            add_stock_articles_to_database(article_id=article_id, stock_ids=stock_ids, connection=connection)
+def get_existing_urls(urls, connection):
+    """
+    Gets a list of urls and returns the set of those already in the database.
+    Urls the url filter has never seen are new for sure and are not looked up.
+    """
+    hashes = {url_hash(url): url for url in urls}
+    if url_filter is not None:
+        hashes = {digest: url for digest, url in hashes.items() if digest in url_filter}
+    return {hashes[digest] for digest in select_ids("Articles", "article_id", "url_hash", hashes, connection)}
 
-            tags = article_data_dict['tags']
-            tag_ids = add_tags_to_database(tag_list=tags, connection=connection)
 
-            add_article_tags_to_database(article_id=article_id, tag_ids=tag_ids, connection=connection)
-            logger.info(f'article "{title}" was added to the database with id: {article_id}')
+# Function assumes database was created in the main program
+def update_database(articles_list, connection, overwrite=False):
+    """
+    Gets a list of article objects and updates the database with new information.
+    If overwrite, the articles already in the database are replaced by the new information.
+    """
+    logger.info('Number of articles: %d', len(articles_list))
+    if articles_list and type(articles_list) == list:
+        bulk_insert_articles([article.row_info() for article in articles_list], connection, overwrite)
     else:
-        logger.error(f'articles_list was empty or in the wrong format\n{articles_list}')
\ No newline at end of file
+        logger.error('articles_list was empty or in the wrong format\n%s', articles_list)
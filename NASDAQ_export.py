@@ -0,0 +1,204 @@
+import json
+import argparse
+import os
+import glob
+import pymysql.cursors
+import pyarrow as pa
+import pyarrow.ipc
+import pyarrow.parquet as pq
+from NASDAQ_config import config, get_logger, setup_logging
+
+logger = get_logger("NASDAQ_export")
+
+ARTICLES_SCHEMA = pa.schema([('article_id', pa.int64()), ('published_date', pa.timestamp('s')),
+                             ('title', pa.string()), ('url', pa.string()), ('author', pa.string()),
+                             ('article_content', pa.large_string()), ('tickers', pa.list_(pa.string())),
+                             ('tags', pa.list_(pa.string()))])
+PRICES_SCHEMA = pa.schema([('stock_price_id', pa.int64()), ('stock_id', pa.int64()), ('stock_tick', pa.string()),
+                           ('date', pa.timestamp('s')), ('open', pa.float64()), ('high', pa.float64()),
+                           ('low', pa.float64()), ('close', pa.float64()), ('volume', pa.int64())])
+STATE_FILE = "_export_state.json"
+EXTENSIONS = {"arrow": ".arrow", "parquet": ".parquet"}
+
+
+def load_state(directory):
+    """
+    Returns the watermarks of the last export to the directory: the last exported article_id and stock_price_id,
+    and the newest exported price date.
+    """
+    path = os.path.join(directory, STATE_FILE)
+    if not os.path.exists(path):
+        return {'last_article_id': 0, 'last_stock_price_id': 0, 'last_price_date': None}
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_state(directory, state):
+    """
+    Writes the export watermarks atomically.
+    """
+    path = os.path.join(directory, STATE_FILE)
+    with open(f"{path}.tmp", 'w') as file:
+        json.dump(state, file)
+    os.replace(f"{path}.tmp", path)
+
+
+def _month(value):
+    """
+    Returns the month partition of a datetime ("2023-05"), "unknown" for a missing date.
+    """
+    return value.strftime("%Y-%m") if value is not None else "unknown"
+
+
+def write_partitions(rows, schema, kind, date_column, first_id, directory, file_format):
+    """
+    Writes a batch of rows to one file per month partition: <directory>/<kind>/month=<YYYY-MM>/part-<first_id>.
+    The file name only depends on the batch, so an export that is interrupted and run again overwrites its files.
+    """
+    months = {}
+    for row in rows:
+        months.setdefault(_month(row[date_column]), []).append(row)
+    for month, month_rows in months.items():
+        table = pa.Table.from_pylist(month_rows, schema=schema)
+        folder = os.path.join(directory, kind, f"month={month}")
+        os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, f"part-{first_id:012d}{EXTENSIONS[file_format]}")
+        if file_format == "arrow":
+            # uncompressed Arrow IPC files can be memory mapped without copying
+            with pa.OSFile(f"{path}.tmp", 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+                writer.write_table(table)
+        else:
+            pq.write_table(table, f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+
+
+def _article_links(first_id, last_id, connection):
+    """
+    Returns dicts of article_id -> tickers and article_id -> tags for the articles first_id to last_id.
+    """
+    cursor = connection.cursor()
+    tickers, tags = {}, {}
+    cursor.execute("SELECT sa.article_id, s.stock_tick FROM Stock_Articles sa JOIN Stocks s "
+                   "ON s.stock_id = sa.stock_id WHERE sa.article_id BETWEEN %s AND %s", (first_id, last_id))
+    for row in cursor.fetchall():
+        tickers.setdefault(row['article_id'], []).append(row['stock_tick'])
+    cursor.execute("SELECT t.article_id, g.tag_name FROM Article_Tags t JOIN Tags g "
+                   "ON g.tag_id = t.tag_id WHERE t.article_id BETWEEN %s AND %s", (first_id, last_id))
+    for row in cursor.fetchall():
+        tags.setdefault(row['article_id'], []).append(row['tag_name'])
+    return tickers, tags
+
+
+def export_articles(state, directory, file_format, connection):
+    """
+    Exports the articles newer than the last exported article_id, with their tickers and tags, EXPORT batch_size
+    articles at a time. Returns the number of articles exported.
+    """
+    cursor = connection.cursor()
+    exported = 0
+    while True:
+        cursor.execute("SELECT a.article_id, a.published_date, a.title, a.url, au.author_name AS author, "
+                       "a.article_content FROM Articles a LEFT JOIN Authors au ON au.author_id = a.author_id "
+                       "WHERE a.article_id > %s ORDER BY a.article_id LIMIT %s",
+                       (state['last_article_id'], config["EXPORT"]["batch_size"]))
+        rows = cursor.fetchall()
+        if not rows:
+            return exported
+        first_id, last_id = rows[0]['article_id'], rows[-1]['article_id']
+        tickers, tags = _article_links(first_id, last_id, connection)
+        for row in rows:
+            row['tickers'] = tickers.get(row['article_id'], [])
+            row['tags'] = tags.get(row['article_id'], [])
+        write_partitions(rows, ARTICLES_SCHEMA, "articles", 'published_date', first_id, directory, file_format)
+        state['last_article_id'] = last_id
+        save_state(directory, state)
+        exported += len(rows)
+        logger.info('Exported the articles %d to %d', first_id, last_id)
+
+
+def export_prices(state, directory, file_format, connection):
+    """
+    Exports the prices added since the last export, EXPORT batch_size rows at a time. The rows are followed by
+    stock_price_id rather than by date, so the older prices of a newly added stock are exported too.
+    Returns the number of prices exported.
+    """
+    cursor = connection.cursor()
+    exported = 0
+    while True:
+        cursor.execute("SELECT p.stock_price_id, p.stock_id, s.stock_tick, p.date, p.open, p.high, p.low, p.close, "
+                       "p.volume FROM Stocks_Prices p JOIN Stocks s ON s.stock_id = p.stock_id "
+                       "WHERE p.stock_price_id > %s ORDER BY p.stock_price_id LIMIT %s",
+                       (state['last_stock_price_id'], config["EXPORT"]["batch_size"]))
+        rows = cursor.fetchall()
+        if not rows:
+            return exported
+        for row in rows:
+            for column in ('open', 'high', 'low', 'close'):
+                row[column] = float(row[column]) if row[column] is not None else None
+        first_id = rows[0]['stock_price_id']
+        write_partitions(rows, PRICES_SCHEMA, "prices", 'date', first_id, directory, file_format)
+        newest = max((row['date'] for row in rows if row['date'] is not None), default=None)
+        if newest is not None and (state['last_price_date'] is None or newest.isoformat() > state['last_price_date']):
+            state['last_price_date'] = newest.isoformat()
+        state['last_stock_price_id'] = rows[-1]['stock_price_id']
+        save_state(directory, state)
+        exported += len(rows)
+        logger.info('Exported the prices %d to %d', first_id, rows[-1]['stock_price_id'])
+
+
+def export_database(connection, directory=None, file_format=None):
+    """
+    Exports the articles (with their tickers and tags) and the prices added since the last export to month
+    partitioned Arrow IPC or Parquet files. Returns the numbers of articles and prices exported.
+    """
+    directory = directory or config["EXPORT"]["dir"]
+    file_format = file_format or config["EXPORT"]["format"]
+    os.makedirs(directory, exist_ok=True)
+    state = load_state(directory)
+    articles = export_articles(state, directory, file_format, connection)
+    prices = export_prices(state, directory, file_format, connection)
+    return articles, prices
+
+
+def read_export(kind, directory=None):
+    """
+    Returns a pyarrow Table of every exported file of a kind ('articles' or 'prices'). Arrow IPC files are memory
+    mapped, so the table is not copied into memory; Parquet files are decoded.
+    """
+    directory = directory or config["EXPORT"]["dir"]
+    tables = []
+    for path in sorted(glob.glob(os.path.join(directory, kind, "month=*", "part-*"))):
+        if path.endswith(EXTENSIONS["arrow"]):
+            tables.append(pa.ipc.open_file(pa.memory_map(path, 'r')).read_all())
+        elif path.endswith(EXTENSIONS["parquet"]):
+            tables.append(pq.read_table(path, memory_map=True))
+    schema = ARTICLES_SCHEMA if kind == "articles" else PRICES_SCHEMA
+    return pa.concat_tables(tables) if tables else schema.empty_table()
+
+
+def parse():
+    """
+    parsing arguments from command line
+    """
+    parser = argparse.ArgumentParser(prog='NASDAQ_export',
+                                     description='incremental columnar export of the NASDAQ database',
+                                     epilog='for further information please see README.md file')
+    parser.add_argument('--dir', default=config["EXPORT"]["dir"], help="export folder")
+    parser.add_argument('--format', choices=sorted(EXTENSIONS), default=config["EXPORT"]["format"])
+    return parser.parse_args()
+
+
+def main():
+    setup_logging("NASDAQ_export")
+    args = parse()
+    connection = pymysql.connect(host=config["HOST"],
+                                 user=config["USER"],
+                                 password=config["PASSWORD"],
+                                 database=config["DB"],
+                                 cursorclass=pymysql.cursors.DictCursor)
+    articles, prices = export_database(connection, args.dir, args.format)
+    print(f'Exported {articles} articles and {prices} prices to {args.dir}')
+
+
+if __name__ == "__main__":
+    main()
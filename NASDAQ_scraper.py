@@ -1,32 +1,94 @@
-import logging
-import os
-
-if not os.path.exists("logs"):
-    os.makedirs("logs")
-import pymysql.cursors
-import gevent.monkey
-
-if not gevent.monkey.saved:
+if __name__ == "__main__":
+    # patched before anything imports socket or ssl, and only when run as the scraper: importing this module as a
+    # library leaves the process unpatched
+    import gevent.monkey
     gevent.monkey.patch_all()
-import grequests
+import pymysql.cursors
+import os
+import time
+from datetime import timedelta
+from itertools import count
 from bs4 import BeautifulSoup
-import json
-from Class_Article import Article
+from Class_Article import Article, make_soup, parse_article_html
+from Class_FetchEngine import make_engine, requested_url
+from Class_HtmlArchive import HtmlArchive, load_page
+from Class_CrawlCheckpoint import CrawlCheckpoint
+from Class_DateParser import date_parser, parse_user_date
+from Class_Metrics import metrics, current_rss_mb, peak_rss_mb
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 import argparse
-import dateparser
 import NASDAQ_datacollecter
+import NASDAQ_workqueue
 import API_datacollector
+from NASDAQ_config import config, get_logger, setup_logging
+
+logger = get_logger("NASDAQ_scraper")
+
+# fetch engine selected in the FETCH section of the conf file, made by get_engine on the first fetch
+engine = None
+
+# archive of the fetched pages, opened by open_archive when HTML_ARCHIVE dir is set
+archive = None
+
+# progress of the crawl, opened by open_checkpoint when CHECKPOINT file is set
+checkpoint = None
+
+
+def get_engine():
+    """
+    Returns the fetch engine, made on the first call.
+    """
+    global engine
+    if engine is None:
+        engine = make_engine(config)
+    return engine
+
+
+def open_archive():
+    """
+    Opens the raw HTML archive configured in the HTML_ARCHIVE section of the conf file, if any.
+    """
+    global archive
+    if config["HTML_ARCHIVE"]["dir"]:
+        archive = HtmlArchive(config["HTML_ARCHIVE"]["dir"])
+
+
+def open_checkpoint(args):
+    """
+    Opens the crawl checkpoint configured in the CHECKPOINT section of the conf file, if any.
+    With --resume, loads the checkpoint of the interrupted crawl (and its number of pages) and returns the Article
+    objects it parsed but did not write to the database, else starts a new checkpoint and returns an empty list.
+    """
+    global checkpoint
+    if not config["CHECKPOINT"]["file"]:
+        return []
+    checkpoint = CrawlCheckpoint(config["CHECKPOINT"]["file"], config["CHECKPOINT"]["snapshot_pages"])
+    if args.resume and checkpoint.exists():
+        rows = checkpoint.load()
+        args.pages = checkpoint.pages
+        print(f'Resuming the crawl: {len(checkpoint.pages_done)} listing pages done, '
+              f'{len(checkpoint.links)} article links found, {len(rows)} parsed articles not stored yet')
+        return [Article.from_row(row) for row in rows]
+    if args.resume:
+        print('No checkpoint to resume, starting a new crawl')
+    checkpoint.start(args.pages)
+    return []
+
+
+def journal_article(article):
+    """
+    Records a parsed article in the crawl checkpoint until it is written to the database, when a checkpoint is open.
+    """
+    if checkpoint is not None:
+        checkpoint.article_parsed(article.row_info())
 
-# logging config
-logger = logging.getLogger("NASDAQ_scraper")
-logger.setLevel(logging.INFO)
-handler = logging.FileHandler("logs/NASDAQ_scraper.log", mode="w")
-formatter = logging.Formatter("%(asctime)s - %(levelname)s - %(message)s")
-handler.setFormatter(formatter)
-logger.addHandler(handler)
 
-with open("conf.json") as f:
-    config = json.load(f)
+def archive_response(response, kind):
+    """
+    Stores the content of a listing or article response in the raw HTML archive, when it is open.
+    """
+    if archive is not None:
+        archive.put(requested_url(response), kind, response.content)
 
 
 def scrape_page(url, args):
@@ -35,25 +97,27 @@ def scrape_page(url, args):
     """
     logger.info('Scrape Page Phase')
     soup = BeautifulSoup(url.text, 'html.parser')
-    pages = [f"https://www.nasdaq.com{a['href']}" for a in soup.find_all('a', class_="content-feed__card-title-link")]
+    pages = [f"{config['NASDAQ_URL']}{a['href']}" for a in soup.find_all('a', class_="content-feed__card-title-link")]
     times = soup.find_all('div', class_='content-feed__card-timestamp')
     if args.time is not None:
-        for i, time in enumerate(times[0:-2:2]):
-            if dateparser.parse(time.text) < args.time:
-                return True, pages[:i - 1]
+        for i, time_stamp in enumerate(times[0:-2:2]):
+            if date_parser.parse(time_stamp.text) < args.time:
+                return True, pages[:i]
     return False, pages[:len(pages) - 1]
 
 
 def get_response(urls):
     """
-    using grequests threads to get responses from several web pages at a time.
+    using the fetch engine to get responses from several web pages at a time.
+    The urls that got no response after the engine retries are logged and left out.
     """
-    logger.info(f'Sending the following urls to grequests\n{urls}')
-    headers = {'User-agent': config["HEADERS"]}
-    request = [grequests.get(url, headers=headers, timeout=config['TIMEOUT']) for url in urls]
-    responses = grequests.map(request)
-    logger.info(f"Got these responses:\n{responses}")
-    responses = [res for res in responses if res]
+    logger.debug('Sending the following urls to the fetch engine\n%s', urls)
+    responses = get_engine().map(urls)
+    logger.debug("Got these responses:\n%s", responses)
+    failed = [url for url, res in zip(urls, responses) if res is None]
+    if failed:
+        logger.error("No response for %d urls: %s", len(failed), failed)
+    responses = [res for res in responses if res is not None]
     return responses
 
 
@@ -63,16 +127,13 @@ def batch_url_list(pages, i):
     """
     logger.info('Batch URL Phase')
     if pages - i < 10:
-        ten_pages = [f'https://www.nasdaq.com/news-and-insights/topic/markets/page/{j}' for j in
-                     range(i, i + (pages - i + 1))]
-        logger.info(f'successfully created links batch number: {pages}.\n The links: '
-                    f'{ten_pages}')
+        ten_pages = [f'{config["INASDAQ_MARKETS_URL"]}{j}' for j in range(i, i + (pages - i + 1))]
+        logger.debug('successfully created links batch number: %d.\n The links: %s', pages, ten_pages)
 
     else:
-        ten_pages = [f'https://www.nasdaq.com/news-and-insights/topic/markets/page/{j}' for j in
-                     range(i, i + config["BATCH_SIZE"])]
-        logger.info(f'successfully created links batch number: {i // config["BATCH_SIZE"] + 1}.\n The links: '
-                    f'{ten_pages}')
+        ten_pages = [f'{config["INASDAQ_MARKETS_URL"]}{j}' for j in range(i, i + config["BATCH_SIZE"])]
+        logger.debug('successfully created links batch number: %d.\n The links: %s', i // config["BATCH_SIZE"] + 1,
+                     ten_pages)
     return ten_pages
 
 
@@ -84,85 +145,422 @@ def responses_batch(ten_pages):
     try:
         responses = get_response(ten_pages)
         if responses:
-            logger.info(f'Got responses from server for the urls: {ten_pages}')
+            logger.debug('Got responses from server for the urls: %s', ten_pages)
         else:
             print(f'{responses} Responses returned None for {ten_pages}')
-            logger.error(f"Responses returned None {ten_pages}")
+            logger.error("Responses returned None %s", ten_pages)
     except Exception as err:
-        logger.error(f"error getting responses from pages: {ten_pages}")
+        logger.error("error getting responses from pages: %s", ten_pages)
         raise RuntimeError(f"error getting responses: {err}")
     return responses
 
 
-def fetch_articles_urls(args):
+def page_is_known(scraped_pages, existing):
+    """
+    Returns True if every article url of a listing page is in the set of urls already in the database.
+    """
+    return all(url in existing for url in scraped_pages)
+
+
+def apply_high_water_mark(args, connection):
+    """
+    Sets the time filter of an incremental crawl to the published date of the newest article ingested, minus the
+    configured overlap, unless a time filter was given.
+    """
+    high_water_mark = NASDAQ_datacollecter.get_high_water_mark(connection)
+    logger.info('High-water mark: %s', high_water_mark)
+    if args.time is None and high_water_mark and high_water_mark['published_date']:
+        args.time = high_water_mark['published_date'] - timedelta(hours=config["INCREMENTAL"]["overlap_hours"])
+
+
+def fetch_articles_urls(args, connection=None):
     """
     creates the article pages urls in batches according to the conf file and calls the get_response (server response) and scrape_page
     functions.
+    In an incremental crawl, stops once more than overlap_pages listing pages in a row hold only known articles.
+    When a crawl checkpoint is open, the listing pages it holds are not fetched again and their links are returned.
     """
     logger.info('Fetch Articles Phase')
-    new_links = []
+    new_links = list(checkpoint.links) if checkpoint is not None else []
+    if checkpoint is not None and checkpoint.listing_done:
+        return new_links
+    known_pages = 0
 
     for i in range(1, args.pages + 1, config["BATCH_SIZE"]):
         ten_pages = batch_url_list(args.pages, i)
+        if checkpoint is not None:
+            ten_pages = [page for page in ten_pages if page not in checkpoint.pages_done]
+            if not ten_pages:
+                continue
         responses = responses_batch(ten_pages)
         for url in responses:
             if url.status_code == config["STATUS_CODE"]:
 
+                archive_response(url, 'listing')
                 stop, scraped_pages = scrape_page(url, args)
                 if scraped_pages:
-                    logger.info(f"successfully scraped {scraped_pages}\n")
+                    logger.debug("successfully scraped %s\n", scraped_pages)
                     new_links = new_links + scraped_pages
                 else:
-                    logger.error(f"could not scrape response page")
+                    logger.error("could not scrape response page")
+                if checkpoint is not None:
+                    checkpoint.page_done(requested_url(url), scraped_pages)
+                if args.incremental:
+                    existing = NASDAQ_datacollecter.get_existing_urls(scraped_pages, connection)
+                    known_pages = known_pages + 1 if page_is_known(scraped_pages, existing) else 0
+                    stop = stop or known_pages > config["INCREMENTAL"]["overlap_pages"]
                 if stop:
                     print(f'Batch number {i // config["BATCH_SIZE"] + 1}/100 done')
                     return new_links
             else:
-                logger.error(f"Request failed with status code: {url.status_code}")
+                logger.error("Request for %s failed with status code: %s", requested_url(url), url.status_code)
     print(f"successfully scraped {len(new_links)}")
     return new_links
 
 
+def parse_executor():
+    """
+    Returns a process pool for parsing article pages, or None when parsing should run inline
+    (PARSE_WORKERS is 0 in the conf file).
+    """
+    if config["PARSE_WORKERS"] > 0:
+        return ProcessPoolExecutor(max_workers=config["PARSE_WORKERS"])
+    return None
+
+
+def record_parse(info):
+    """
+    Records the parse time measured by parse_article_html in the metrics and returns the article information.
+    """
+    metrics.observe('article_parse_seconds', info['parse_seconds'])
+    return info
+
+
+def collect_parsed(pending, block=False):
+    """
+    Gets a dict of parse futures -> Article objects and returns the articles whose parsing has finished,
+    with their information set and recorded in the crawl checkpoint. If block is True, waits for at least one parse
+    to finish.
+    """
+    if block and pending:
+        wait(pending, return_when=FIRST_COMPLETED)
+    parsed = []
+    for future in [future for future in pending if future.done()]:
+        article = pending.pop(future)
+        article.set_fields(record_parse(future.result()))
+        journal_article(article)
+        parsed.append(article)
+    return parsed
+
+
 def setting_info(article_list, connection):
     """
-    Takes a list of Article objects and creates a dataframe with the article information.
-    Prints the article short information without the content.
-    The article content will be saved into a text file in a sub-folder named "article content files".
+    Takes a list of Article objects, fetches every article page and sets the article information.
+    Article pages are parsed inline, or in a process pool of PARSE_WORKERS processes when configured, while
+    the pages are fetched BATCH_SIZE at a time.
+    The articles are written to the database when the batch is full (see batch_is_full).
     """
     logger.info('Setting Info Phase')
-    headers = {'User-agent': config["HEADERS"]}
+    articles_by_url = {t.url: t for t in article_list}
+
+    article_object_info = []
+    batch_bytes = 0
+    pending = {}
+    executor = parse_executor()
     try:
-        logger.info('Setting Info Phases Started')
-        rs = (grequests.get(t.url, headers=headers, timeout=config['TIMEOUT']) for t in article_list)
-        logger.info(f'successfully got responses from server')
-    except Exception as err:
-        logger.error(f"error getting responses from server: {err}")
-        raise RuntimeError(f"error getting responses: {err}")
+        for response in get_engine().imap(list(articles_by_url)):
+            parsed = []
+            if response.status_code == config["STATUS_CODE"]:
+                # popped, so the stored articles are not kept alive until the end of the crawl
+                article = articles_by_url.pop(requested_url(response), None)
+                if article:
+                    archive_response(response, 'article')
+                    if executor:
+                        pending[executor.submit(parse_article_html, response.content)] = article
+                    else:
+                        with metrics.timer('article_parse_seconds'):
+                            # Parses the HTML content and returns a soup object.
+                            soup = make_soup(response.content)
+                            article.set_info(soup)
+                            soup.decompose()
+                        journal_article(article)
+                        parsed.append(article)
+            else:
+                logger.error("Request for %s failed with status code: %s", requested_url(response),
+                             response.status_code)
+
+            # keeps at most a few pages per parse worker waiting, so fetching does not run ahead of parsing
+            block = len(pending) >= 2 * config["PARSE_WORKERS"]
+            parsed += collect_parsed(pending, block=block)
+            article_object_info += parsed
+            batch_bytes += sum(article.size_bytes() for article in parsed)
+            if batch_is_full(len(article_object_info), batch_bytes):
+                store_articles(article_object_info, connection)
+                article_object_info = []
+                batch_bytes = 0
+
+        while pending:
+            article_object_info += collect_parsed(pending, block=True)
+    finally:
+        if executor:
+            executor.shutdown(cancel_futures=True)
+    store_articles(article_object_info, connection)
+
+
+def batch_is_full(count, size):
+    """
+    Returns True when a batch of count articles holding size bytes of text has to be written to the database:
+    at INSERT articles, at FLUSH_BYTES bytes, or once the process uses more than MEMORY_LIMIT_MB. The memory limit
+    is only checked from a tenth of INSERT articles, so a process that stays above it still writes real batches.
+    """
+    if count >= config["INSERT"] or size >= config["FLUSH_BYTES"]:
+        return True
+    limit = config["MEMORY_LIMIT_MB"]
+    if limit and count >= max(1, config["INSERT"] // 10) and current_rss_mb() >= limit:
+        logger.warning("Memory use above %d MB, writing a batch of %d articles early", limit, count)
+        metrics.inc('memory_limit_flushes_total')
+        return True
+    return False
+
+
+def store_articles(article_object_info, connection):
+    """
+    Prints the scraped articles and writes them to the database, then empties the journal of the crawl checkpoint.
+    """
+    for article in article_object_info:
+        print(article)
+        logger.debug("successfully scraped %s\n", article.title)
+    NASDAQ_datacollecter.update_database(article_object_info, connection)
+    if checkpoint is not None:
+        checkpoint.batch_flushed()
+
 
-    countdown = 0
+def produce_links(args, links_queue, workers, connection, db_lock):
+    """
+    Walks the listing pages and puts the article urls that are not in the database yet on the links queue.
+    Puts one None per worker on the queue once the listing pages are done.
+    """
+    logger.info('Produce Links Phase')
+    seen = set()
+    known_pages = 0
+    try:
+        for i in range(1, args.pages + 1, config["BATCH_SIZE"]):
+            ten_pages = batch_url_list(args.pages, i)
+            responses = responses_batch(ten_pages)
+            for response in responses:
+                if response.status_code != config["STATUS_CODE"]:
+                    logger.error("Request for %s failed with status code: %s", requested_url(response),
+                             response.status_code)
+                    continue
+                archive_response(response, 'listing')
+                stop, scraped_pages = scrape_page(response, args)
+                with db_lock:
+                    existing = NASDAQ_datacollecter.get_existing_urls(scraped_pages, connection)
+                new_links = [url for url in scraped_pages if url not in existing and url not in seen]
+                seen.update(new_links)
+                logger.info("Queueing %d new links", len(new_links))
+                for url in new_links:
+                    links_queue.put(url)  # blocks while the article workers are behind
+                if args.incremental:
+                    known_pages = known_pages + 1 if page_is_known(scraped_pages, existing) else 0
+                    stop = stop or known_pages > config["INCREMENTAL"]["overlap_pages"]
+                if stop:
+                    return
+    finally:
+        for _ in range(workers):
+            links_queue.put(None)
+
+
+def consume_links(links_queue, ids, batch, executor, connection, db_lock):
+    """
+    Takes article urls from the links queue until it gets None, fetches and parses every article and adds it to
+    the shared batch. The batch is written to the database when it is full (see batch_is_full) or every
+    FLUSH_INTERVAL seconds.
+    """
+    while True:
+        url = links_queue.get()
+        if url is None:
+            return
+        response = get_engine().get(url)
+        if response is None:
+            continue
+        if response.status_code != config["STATUS_CODE"]:
+            logger.error("Request for %s failed with status code: %s", requested_url(response),
+                         response.status_code)
+            continue
+        archive_response(response, 'article')
+        article = Article(next(ids), url)
+        if executor:
+            article.set_fields(record_parse(executor.submit(parse_article_html, response.content).result()))
+        else:
+            article.set_fields(record_parse(parse_article_html(response.content)))
+        batch['articles'].append(article)
+        batch['bytes'] += article.size_bytes()
+        if batch_is_full(len(batch['articles']), batch['bytes']) or \
+                time.monotonic() - batch['flushed'] >= config["FLUSH_INTERVAL"]:
+            flush_batch(batch, connection, db_lock)
 
+
+def flush_batch(batch, connection, db_lock):
+    """
+    Writes the articles collected in the shared batch to the database and empties it.
+    """
+    articles, batch['articles'] = batch['articles'], []
+    batch['bytes'] = 0
+    batch['flushed'] = time.monotonic()
+    if articles:
+        with db_lock:
+            store_articles(articles, connection)
+
+
+def stream_articles(args, connection):
+    """
+    Streams article urls from the listing pages to BATCH_SIZE article workers through a bounded queue, so articles
+    are fetched and stored while the listing pages are still being walked.
+    """
+    import gevent
+    import gevent.lock
+    import gevent.queue
+    logger.info('Stream Articles Phase')
+    workers = config["BATCH_SIZE"]
+    links_queue = gevent.queue.Queue(maxsize=config["LINKS_QUEUE_SIZE"])
+    db_lock = gevent.lock.BoundedSemaphore()
+    batch = {'articles': [], 'bytes': 0, 'flushed': time.monotonic()}
+    executor = parse_executor()
+    greenlets = []
+    try:
+        greenlets = [gevent.spawn(produce_links, args, links_queue, workers, connection, db_lock)]
+        ids = count()
+        greenlets += [gevent.spawn(consume_links, links_queue, ids, batch, executor, connection, db_lock)
+                      for _ in range(workers)]
+        gevent.joinall(greenlets, raise_error=True)
+        flush_batch(batch, connection, db_lock)
+    finally:
+        gevent.killall(greenlets)
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+
+def reparse_page(page):
+    """
+    Gets a (url, digest) pair of an archived article page and returns the url with the article information parsed
+    from the archived content. Runs in a worker process.
+    """
+    url, digest = page
+    return url, parse_article_html(load_page(config["HTML_ARCHIVE"]["dir"], digest))
+
+
+def reparse_archive(connection):
+    """
+    Parses every article page of the raw HTML archive again, on all cores and without network access, and replaces
+    the articles, their tags and their tickers in the database.
+    """
+    logger.info('Reparse Phase')
+    pages = archive.pages('article')
+    print(f'Reparsing {len(pages)} archived articles')
     article_object_info = []
-    for response in grequests.imap(rs, size=config["BATCH_SIZE"]):
+    batch_bytes = 0
+    with ProcessPoolExecutor(max_workers=os.cpu_count()) as executor:
+        for id_num, (url, info) in enumerate(executor.map(reparse_page, pages, chunksize=config["BATCH_SIZE"])):
+            article = Article(id_num, url)
+            article.set_fields(record_parse(info))
+            article_object_info.append(article)
+            batch_bytes += article.size_bytes()
+            if batch_is_full(len(article_object_info), batch_bytes):
+                NASDAQ_datacollecter.update_database(article_object_info, connection, overwrite=True)
+                article_object_info = []
+                batch_bytes = 0
+    NASDAQ_datacollecter.update_database(article_object_info, connection, overwrite=True)
+
+
+def process_listing_range(args, item, connection):
+    """
+    Fetches the listing pages of a work queue range ("<first>-<last>") and queues the article urls that are not in
+    the database yet. Returns True if every page of the range was scraped.
+    """
+    first, last = (int(page) for page in item['payload'].split('-'))
+    pages = [f'{config["INASDAQ_MARKETS_URL"]}{j}' for j in range(first, last + 1)]
+    links = []
+    scraped = 0
+    for response in get_response(pages):
         if response.status_code == config["STATUS_CODE"]:
-            article = next((t for t in article_list if t.url == response.url), None)
-            if article:
-                # Parses the HTML content and returns a soup object.
-                soup = BeautifulSoup(response.content, "html.parser")
-                article.set_info(soup)
-                print(article)
-                logger.info(f"successfully scraped {article.title}\n")
-
-                # concat to object list
-
-                article_object_info.append(article)
-                countdown += 1
-                if countdown >= config["INSERT"]:
-                    NASDAQ_datacollecter.update_database(article_object_info, connection)
-                    article_object_info = []
-                    countdown = 0
+            archive_response(response, 'listing')
+            _, scraped_pages = scrape_page(response, args)
+            links += scraped_pages
+            scraped += 1
         else:
-            logger.error(f"Request failed with status code: {response.status_code}")
-    NASDAQ_datacollecter.update_database(article_object_info, connection)
+            logger.error("Request for %s failed with status code: %s", requested_url(response),
+                         response.status_code)
+    existing = NASDAQ_datacollecter.get_existing_urls(links, connection)
+    NASDAQ_workqueue.add_items(NASDAQ_workqueue.ARTICLE, [url for url in links if url not in existing], connection)
+    return scraped == len(pages)
+
+
+def process_claimed_items(args, items, done, failed, connection):
+    """
+    Fetches the claimed listing ranges and queues their article urls, and fetches, parses and stores the claimed
+    articles through update_database. Appends the ids of the processed items to done and of the others to failed.
+    """
+    for item in items:
+        if item['kind'] == NASDAQ_workqueue.LISTING:
+            (done if process_listing_range(args, item, connection) else failed).append(item['item_id'])
+    article_items = {item['payload']: item['item_id'] for item in items if item['kind'] == NASDAQ_workqueue.ARTICLE}
+    if article_items:
+        setting_info(get_articles(list(article_items)), connection)
+        stored = NASDAQ_datacollecter.get_existing_urls(article_items, connection)
+        done += [item_id for url, item_id in article_items.items() if url in stored]
+        failed += [item_id for url, item_id in article_items.items() if url not in stored]
+
+
+def run_queue_worker(args, connection):
+    """
+    Claims items from the work queue until it is finished and processes them with process_claimed_items.
+    The items that could not be processed are released for another attempt. A lock wait timeout or a deadlock
+    between workers releases the items not done yet and the worker claims again; on any other error they are
+    released before the error is raised.
+    """
+    logger.info('Queue Worker Phase')
+    owner = NASDAQ_workqueue.worker_id()
+    print(f'Worker {owner} started')
+    while True:
+        items = NASDAQ_workqueue.claim_items(owner, connection)
+        if not items:
+            if NASDAQ_workqueue.queue_is_finished(connection):
+                print(f'Worker {owner}: the queue is finished')
+                return
+            # other workers hold leases, and may queue more articles or let their leases expire
+            import gevent
+            gevent.sleep(config["WORK_QUEUE"]["poll_seconds"])
+            continue
+        done, failed = [], []
+        try:
+            process_claimed_items(args, items, done, failed, connection)
+        except Exception as err:
+            connection.rollback()
+            failed = [item['item_id'] for item in items if item['item_id'] not in done]
+            NASDAQ_workqueue.complete_items(done, owner, connection)
+            NASDAQ_workqueue.release_items(failed, owner, connection)
+            if not (isinstance(err, pymysql.MySQLError) and err.args[0] in NASDAQ_workqueue.RETRYABLE_ERRORS):
+                raise
+            logger.warning("Worker %s: %s, %d items released for another attempt", owner, err, len(failed))
+            metrics.inc('queue_retries_total')
+            continue
+        NASDAQ_workqueue.complete_items(done, owner, connection)
+        NASDAQ_workqueue.release_items(failed, owner, connection)
+        logger.info("Worker %s: %d items done, %d released", owner, len(done), len(failed))
+
+
+def print_queue_progress(connection):
+    """
+    Prints the number of done, pending, leased and failed items of every kind in the work queue.
+    """
+    progress = NASDAQ_workqueue.queue_progress(connection)
+    for kind, states in sorted(progress.items()):
+        total = sum(states.values())
+        print(f"{kind}: {states.get('done', 0)}/{total} done, {states.get('pending', 0)} pending, "
+              f"{states.get('leased', 0)} leased, {states.get('failed', 0)} failed")
+    if not progress:
+        print('The work queue is empty')
 
 
 def get_articles(links_list):
@@ -184,21 +582,39 @@ def parse():
                                      epilog='for further information please see README.md file')
     parser.add_argument('--scrape_all', action='store_true', help="scrape all pages and info")
     parser.add_argument('--update', action='store_true', help="update prices from API")
+    parser.add_argument('--reparse', action='store_true',
+                        help="rebuild the articles from the raw HTML archive without network access")
+    parser.add_argument('--offline', action='store_true',
+                        help="replay API responses from the response cache only")
+    parser.add_argument('--incremental', action='store_true',
+                        help="stop at the listing pages holding only articles already in the database")
+    parser.add_argument('--stream', action='store_true',
+                        help="fetch articles while the listing pages are being scraped")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue an interrupted crawl from its checkpoint")
+    parser.add_argument('--seed', action='store_true',
+                        help="add the listing pages to the work queue of a sharded crawl")
+    parser.add_argument('--progress', action='store_true', help="show the progress of the work queue")
+    parser.add_argument('--worker', action='store_true', help="process items from the work queue until it is done")
     parser.add_argument('-pages', type=int, help="scrape x pages (starting from first)", default=config['PAGES'])
-    parser.add_argument('-time', type=dateparser.parse, help="scrape pages x days back till today",
+    parser.add_argument('-time', type=parse_user_date, help="scrape pages x days back till today",
                         default=None)
     args = parser.parse_args()
 
     if args.scrape_all:  # if the user decides to enter scrape all with other arguments
         args.pages = config['PAGES']
         args.time = None
+        args.incremental = False
 
     return args
 
 
 def main():
+    setup_logging("NASDAQ_scraper", "NASDAQ_datacollector", "API_datacollector", "NASDAQ_workqueue")
     args = parse()
-    logger.info(f'Args input: {args}')
+    logger.info('Args input: %s', args)
+    if config["METRICS"]["port"]:
+        metrics.serve(config["METRICS"]["port"])
     try:
         connection = pymysql.connect(host=config["HOST"],
                                      user=config["USER"],
@@ -206,23 +622,75 @@ def main():
                                      database=config["DB"],
                                      cursorclass=pymysql.cursors.DictCursor)
         logger.info('Connection to mysql server')
+        if args.offline:
+            API_datacollector.set_offline()
         NASDAQ_datacollecter.create_database(config["DB_COMMANDS_FILE"], connection)
+        NASDAQ_datacollecter.warm_id_caches(connection)
+        if not args.worker:
+            # each worker would save its own partial url filter over the others
+            NASDAQ_datacollecter.load_url_filter(connection)
+        open_archive()
+        if args.incremental:
+            apply_high_water_mark(args, connection)
         if args.update:
             logger.info("Updating stock prices")
             API_datacollector.update_stock_prices(connection)
+        elif args.reparse:
+            if archive is None:
+                raise RuntimeError('--reparse needs an HTML_ARCHIVE dir in the conf file')
+            reparse_archive(connection)
+        elif args.seed:
+            ranges = NASDAQ_workqueue.seed_queue(args.pages, connection)
+            print(f'Queued {ranges} listing page ranges')
+            print_queue_progress(connection)
+        elif args.progress:
+            print_queue_progress(connection)
+        elif args.worker:
+            run_queue_worker(args, connection)
+        elif args.stream:
+            stream_articles(args, connection)
         else:
-            new_links = fetch_articles_urls(args)  # Gets list of urls to scrape
-            urls = NASDAQ_datacollecter.get_all_urls(connection)  # Gets list of urls that exists in the database
-
-            new_links = list(set(new_links) - set(urls))  # Keeps only the links that don't exist in the database
-            logger.info(f"Collected {len(new_links)} new links")
+            parsed = open_checkpoint(args)
+            if parsed:
+                store_articles(parsed, connection)  # Articles parsed before the interruption
+            new_links = fetch_articles_urls(args, connection)  # Gets list of urls to scrape
+            if checkpoint is not None:
+                checkpoint.finish_listing()
+            urls = NASDAQ_datacollecter.get_existing_urls(new_links, connection)  # The ones already in the database
+
+            new_links = list(set(new_links) - urls)  # Keeps only the links that don't exist in the database
+            logger.info("Collected %d new links", len(new_links))
             get_objects = get_articles(new_links)
             setting_info(get_objects, connection)
-            print('Updating Tickers')
-            logger.info("Adding new tickers to database")
-            API_datacollector.new_tickers(connection)
+            if checkpoint is not None:
+                checkpoint.clear()
+        if not (args.update or args.reparse or args.seed or args.progress):
+            if not args.worker:  # the workers would spend the API quota on the same tickers
+                print('Updating Tickers')
+                logger.info("Adding new tickers to database")
+                API_datacollector.new_tickers(connection)
+            summary = NASDAQ_datacollecter.id_caches_summary()
+            print(summary)
+            logger.info(summary)
+            if engine is not None and engine.failed_urls:
+                print(f'{len(engine.failed_urls)} pages could not be fetched after retries, see the log file')
+                logger.error("Pages not fetched after retries: %s", engine.failed_urls)
     except Exception as err:
         print(f'Error: {err}')
+        if checkpoint is not None and checkpoint.exists():
+            print('The crawl progress was saved, run again with --resume to continue it')
+    finally:
+        # saved after every run, the next load adds the articles stored since it was loaded
+        NASDAQ_datacollecter.save_url_filter()
+        if archive is not None:
+            archive.close()
+        peak = peak_rss_mb()
+        print(f'Peak RSS: {peak:.1f} MB')
+        logger.info("Peak RSS: %.1f MB", peak)
+        metrics.set('peak_rss_mb', peak)
+        logger.info("Date parser: %s", date_parser)
+        if config["METRICS"]["dump_file"]:
+            metrics.dump(config["METRICS"]["dump_file"])
 
 
 if __name__ == "__main__":
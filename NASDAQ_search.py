@@ -0,0 +1,132 @@
+import json
+import argparse
+import pymysql.cursors
+from Class_DateParser import parse_user_date
+from NASDAQ_config import config, get_logger, setup_logging
+
+logger = get_logger("NASDAQ_search")
+
+
+def _dimension_id(table, id_column, name_column, name, connection):
+    """
+    Returns the id of a name in one of the dimension tables (Tags, Stocks), or None if it is not there.
+    """
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT {id_column} FROM {table} WHERE {name_column} = %s", (name,))
+    result = cursor.fetchone()
+    return result[id_column] if result else None
+
+
+def search_articles(connection, text=None, phrase=False, ticker=None, tag=None, start=None, end=None, after=None,
+                    page_size=None):
+    """
+    Returns a page of the articles matching every given filter, newest (highest article_id) first:
+    text - full-text match over the title and content (MySQL boolean mode syntax, or an exact phrase if phrase),
+    ticker / tag - articles linked to the stock ticker / tag, start / end - published_date range [start, end).
+    after is the 'next' value of the previous page. Returns a dict with the 'results' (article_id, title, url,
+    published_date, author) and 'next', None on the last page.
+    """
+    page_size = page_size or config["SEARCH"]["page_size"]
+    joins, where, params = [], [], []
+    if ticker is not None:
+        stock_id = _dimension_id("Stocks", "stock_id", "stock_tick", ticker, connection)
+        if stock_id is None:
+            return {'results': [], 'next': None}
+        joins.append("JOIN Stock_Articles sa ON sa.article_id = a.article_id AND sa.stock_id = %s")
+        params.append(stock_id)
+    if tag is not None:
+        tag_id = _dimension_id("Tags", "tag_id", "tag_name", tag, connection)
+        if tag_id is None:
+            return {'results': [], 'next': None}
+        joins.append("JOIN Article_Tags t ON t.article_id = a.article_id AND t.tag_id = %s")
+        params.append(tag_id)
+    if text:
+        where.append("MATCH (a.title, a.article_content) AGAINST (%s IN BOOLEAN MODE)")
+        params.append(f'"{text}"' if phrase else text)
+    if start is not None:
+        where.append("a.published_date >= %s")
+        params.append(start)
+    if end is not None:
+        where.append("a.published_date < %s")
+        params.append(end)
+    if after is not None:
+        # keyset pagination, the cost of a page does not grow with its position
+        where.append("a.article_id < %s")
+        params.append(after)
+    sql = (f"SELECT a.article_id, a.title, a.url, a.published_date, au.author_name AS author FROM Articles a "
+           f"{' '.join(joins)} LEFT JOIN Authors au ON au.author_id = a.author_id "
+           f"{'WHERE ' + ' AND '.join(where) if where else ''} "
+           f"ORDER BY a.article_id DESC LIMIT %s")
+    params.append(page_size + 1)
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    results = cursor.fetchall()
+    logger.info('Search %s returned %d articles', {'text': text, 'ticker': ticker, 'tag': tag, 'start': start,
+                                                   'end': end, 'after': after}, min(len(results), page_size))
+    next_page = results[page_size - 1]['article_id'] if len(results) > page_size else None
+    return {'results': results[:page_size], 'next': next_page}
+
+
+def article_links(article_ids, connection):
+    """
+    Returns a dict of article_id -> {'tickers': [...], 'tags': [...]} for a page of article ids.
+    """
+    links = {article_id: {'tickers': [], 'tags': []} for article_id in article_ids}
+    if not article_ids:
+        return links
+    placeholders = ", ".join(["%s"] * len(article_ids))
+    cursor = connection.cursor()
+    cursor.execute(f"SELECT sa.article_id, s.stock_tick FROM Stock_Articles sa JOIN Stocks s "
+                   f"ON s.stock_id = sa.stock_id WHERE sa.article_id IN ({placeholders})", list(article_ids))
+    for row in cursor.fetchall():
+        links[row['article_id']]['tickers'].append(row['stock_tick'])
+    cursor.execute(f"SELECT t.article_id, g.tag_name FROM Article_Tags t JOIN Tags g "
+                   f"ON g.tag_id = t.tag_id WHERE t.article_id IN ({placeholders})", list(article_ids))
+    for row in cursor.fetchall():
+        links[row['article_id']]['tags'].append(row['tag_name'])
+    return links
+
+
+def parse():
+    """
+    parsing arguments from command line
+    """
+    parser = argparse.ArgumentParser(prog='NASDAQ_search', description='search the scraped NASDAQ articles',
+                                     epilog='for further information please see README.md file')
+    parser.add_argument('text', nargs='?', help="words to search in the title and content (MySQL boolean mode)")
+    parser.add_argument('--phrase', action='store_true', help="search the text as an exact phrase")
+    parser.add_argument('--ticker', help="articles about a stock ticker")
+    parser.add_argument('--tag', help="articles with a tag")
+    parser.add_argument('--start', type=parse_user_date, help="articles published from this date")
+    parser.add_argument('--end', type=parse_user_date, help="articles published before this date")
+    parser.add_argument('--after', type=int, help="the 'next' value printed by the previous page")
+    parser.add_argument('--page_size', type=int, default=config["SEARCH"]["page_size"])
+    parser.add_argument('--json', action='store_true', help="print the page as json")
+    return parser.parse_args()
+
+
+def main():
+    setup_logging("NASDAQ_search")
+    args = parse()
+    connection = pymysql.connect(host=config["HOST"],
+                                 user=config["USER"],
+                                 password=config["PASSWORD"],
+                                 database=config["DB"],
+                                 cursorclass=pymysql.cursors.DictCursor)
+    page = search_articles(connection, args.text, args.phrase, args.ticker, args.tag, args.start, args.end,
+                           args.after, args.page_size)
+    links = article_links([row['article_id'] for row in page['results']], connection)
+    for row in page['results']:
+        row.update(links[row['article_id']])
+    if args.json:
+        print(json.dumps(page, default=str, indent=2))
+    else:
+        for row in page['results']:
+            print(f"{row['article_id']}  {row['published_date']}  {row['title']}\n    {row['url']}\n"
+                  f"    Tickers: {row['tickers']}, Tags: {row['tags']}")
+        if page['next'] is not None:
+            print(f"Next page: --after {page['next']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -71,4 +71,7 @@ CREATE TABLE IF NOT EXISTS `Stock_Articles` (
     ON DELETE CASCADE
 );
 
-
+CREATE TABLE IF NOT EXISTS `Schema_Version` (
+  `version` int PRIMARY KEY,
+  `applied_at` datetime DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,141 @@
+import hashlib
+import os
+import socket
+from Class_Metrics import metrics
+from NASDAQ_config import config, get_logger
+
+logger = get_logger("NASDAQ_workqueue")
+
+# kinds of the work items: a range of listing pages ("<first>-<last>") or an article url
+LISTING = "listing"
+ARTICLE = "article"
+
+# MySQL errors after which the claimed items are released and the worker carries on:
+# lock wait timeout, deadlock
+RETRYABLE_ERRORS = (1205, 1213)
+
+
+def worker_id():
+    """
+    Returns the name of this worker, recorded as the owner of the items it leases.
+    """
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+def _payload_hash(payload):
+    """
+    Returns the SHA1 hexdigest of an item payload.
+    """
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def add_items(kind, payloads, connection):
+    """
+    Adds work items of a kind to the queue, skipping the ones already queued. Commits.
+    """
+    if payloads:
+        cursor = connection.cursor()
+        cursor.executemany("INSERT IGNORE INTO Work_Queue (kind, payload, payload_hash) VALUES (%s, %s, %s)",
+                           [(kind, payload, _payload_hash(payload)) for payload in payloads])
+        connection.commit()
+        metrics.inc('queue_items_added_total', len(payloads), kind=kind)
+
+
+def seed_queue(pages, connection):
+    """
+    Adds the listing pages 1 to pages to the queue, in ranges of WORK_QUEUE range_size pages.
+    """
+    size = config["WORK_QUEUE"]["range_size"]
+    ranges = [f"{first}-{min(first + size - 1, pages)}" for first in range(1, pages + 1, size)]
+    add_items(LISTING, ranges, connection)
+    logger.info('Seeded the queue with %d listing page ranges', len(ranges))
+    return len(ranges)
+
+
+def claim_items(owner, connection):
+    """
+    Leases up to WORK_QUEUE claim_size items to the owner for lease_seconds, listing ranges first.
+    Pending items and items whose lease has expired can be claimed; the rows locked by other workers are skipped.
+    An expired item already tried max_attempts times (its workers kept dying on it) is marked as failed instead.
+    Returns a list of dicts with the item_id, kind and payload of the claimed items.
+    """
+    queue_config = config["WORK_QUEUE"]
+    cursor = connection.cursor()
+    connection.begin()
+    try:
+        cursor.execute("UPDATE Work_Queue SET state = 'failed', lease_owner = NULL, lease_expires = NULL "
+                       "WHERE state = 'leased' AND lease_expires < NOW() AND attempts >= %s",
+                       (queue_config["max_attempts"],))
+        if cursor.rowcount:
+            logger.error('%d expired items reached %d attempts and were marked as failed', cursor.rowcount,
+                         queue_config["max_attempts"])
+            metrics.inc('queue_items_failed_total', cursor.rowcount)
+        cursor.execute("SELECT item_id, kind, payload FROM Work_Queue "
+                       "WHERE state = 'pending' OR (state = 'leased' AND lease_expires < NOW() AND attempts < %s) "
+                       "ORDER BY kind = 'listing' DESC, item_id LIMIT %s FOR UPDATE SKIP LOCKED",
+                       (queue_config["max_attempts"], queue_config["claim_size"]))
+        items = cursor.fetchall()
+        if items:
+            placeholders = ", ".join(["%s"] * len(items))
+            cursor.execute(f"UPDATE Work_Queue SET state = 'leased', lease_owner = %s, "
+                           f"lease_expires = NOW() + INTERVAL %s SECOND, attempts = attempts + 1 "
+                           f"WHERE item_id IN ({placeholders})",
+                           [owner, queue_config["lease_seconds"]] + [item['item_id'] for item in items])
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    metrics.inc('queue_items_claimed_total', len(items))
+    return items
+
+
+def complete_items(item_ids, owner, connection):
+    """
+    Marks leased items as done, unless their lease was lost to another worker. Commits.
+    """
+    if item_ids:
+        placeholders = ", ".join(["%s"] * len(item_ids))
+        cursor = connection.cursor()
+        cursor.execute(f"UPDATE Work_Queue SET state = 'done', lease_expires = NULL "
+                       f"WHERE lease_owner = %s AND state = 'leased' AND item_id IN ({placeholders})",
+                       [owner] + list(item_ids))
+        connection.commit()
+        metrics.inc('queue_items_done_total', len(item_ids))
+
+
+def release_items(item_ids, owner, connection):
+    """
+    Returns leased items that could not be processed to the queue, or marks them as failed once they were tried
+    WORK_QUEUE max_attempts times. Commits.
+    """
+    if item_ids:
+        placeholders = ", ".join(["%s"] * len(item_ids))
+        cursor = connection.cursor()
+        cursor.execute(f"UPDATE Work_Queue SET state = IF(attempts >= %s, 'failed', 'pending'), "
+                       f"lease_owner = NULL, lease_expires = NULL "
+                       f"WHERE lease_owner = %s AND state = 'leased' AND item_id IN ({placeholders})",
+                       [config["WORK_QUEUE"]["max_attempts"], owner] + list(item_ids))
+        connection.commit()
+        metrics.inc('queue_items_released_total', len(item_ids))
+
+
+def queue_progress(connection):
+    """
+    Returns a dict of kind -> state -> number of items in the queue.
+    """
+    cursor = connection.cursor()
+    cursor.execute("SELECT kind, state, COUNT(*) AS items FROM Work_Queue GROUP BY kind, state")
+    progress = {}
+    for row in cursor.fetchall():
+        progress.setdefault(row['kind'], {})[row['state']] = row['items']
+    # autocommit is off, so the next call has to start a new snapshot
+    connection.commit()
+    return progress
+
+
+def queue_is_finished(connection):
+    """
+    Returns True if no item of the queue is pending or leased.
+    """
+    progress = queue_progress(connection)
+    return not any(states.get('pending') or states.get('leased') for states in progress.values())
@@ -0,0 +1,111 @@
+"""
+Benchmark of the SessionEngine fetch concurrency against a local server that throttles: every request beyond
+--capacity in flight is answered with 429 and a Retry-After header, or with 503 for one in --error-every requests.
+
+Runs the engine with a fixed concurrency and no retries (the behaviour before the AIMD controller), then with the
+AIMD controller and retries, and prints the pages/s, the retries and the urls lost by each.
+
+usage: python benchmarks/bench_adaptive_fetch.py [--urls 500] [--capacity 20] [--latency 0.05]
+"""
+import gevent.monkey
+
+gevent.monkey.patch_all()
+import argparse
+import http.server
+import json
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_handler(capacity, latency, error_every):
+    """
+    Returns the request handler of the throttling server.
+    """
+    state = {'in_flight': 0, 'requests': 0}
+    lock = threading.Lock()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            with lock:
+                state['in_flight'] += 1
+                state['requests'] += 1
+                throttled = state['in_flight'] > capacity
+                failed = error_every and state['requests'] % error_every == 0
+            try:
+                if throttled:
+                    self._send(429, {'Retry-After': '1'})
+                elif failed:
+                    self._send(503, {})
+                else:
+                    time.sleep(latency)
+                    self._send(200, {})
+            finally:
+                with lock:
+                    state['in_flight'] -= 1
+
+        def _send(self, status, headers):
+            body = b"<html><body>page</body></html>"
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def run_engine(engine, urls):
+    """
+    Fetches the urls with the engine and returns its throughput and losses.
+    """
+    from Class_Metrics import metrics
+    metrics.counters.clear()
+    start = time.perf_counter()
+    fetched = sum(1 for response in engine.imap(urls) if response.status_code == 200)
+    elapsed = time.perf_counter() - start
+    retries = sum(value for (name, _), value in metrics.counters.items() if name == 'http_retries_total')
+    return {'seconds': elapsed, 'pages_per_s': fetched / elapsed, 'fetched': fetched, 'lost': len(urls) - fetched,
+            'retries': retries, 'final_limit': int(engine.controller.limit)}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='bench_adaptive_fetch', description='fetch concurrency under throttling')
+    parser.add_argument('--urls', type=int, default=500)
+    parser.add_argument('--capacity', type=int, default=20, help="requests in flight before the server throttles")
+    parser.add_argument('--latency', type=float, default=0.05, help="seconds per successful request")
+    parser.add_argument('--error-every', type=int, default=50, help="answer one in n requests with 503 (0: never)")
+    parser.add_argument('--fixed', type=int, default=40, help="concurrency of the fixed run")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    from Class_FetchEngine import SessionEngine
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0),
+                                             make_handler(args.capacity, args.latency, args.error_every))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    urls = [f"http://127.0.0.1:{server.server_port}/articles/{i}" for i in range(args.urls)]
+
+    fixed = SessionEngine("bench", 10, args.fixed, args.fixed, max_concurrency=args.fixed,
+                          min_concurrency=args.fixed, retries=0)
+    adaptive = SessionEngine("bench", 10, 10, 100, max_concurrency=100, min_concurrency=2, latency_target=1.0,
+                             retries=5, backoff_base=0.2, backoff_max=5)
+    results = {'urls': args.urls, 'capacity': args.capacity,
+               'fixed': run_engine(fixed, urls), 'aimd': run_engine(adaptive, urls)}
+    server.shutdown()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Micro-benchmark of the NASDAQ date parsing: dateparser.parse against the NasdaqDateParser of Class_DateParser.
+
+Builds a mix of the date strings the scraper meets (article dates with a time and time zone, listing card dates,
+relative "N hours ago" dates) with --distinct different absolute dates, checks that both parsers return the same
+datetimes, and prints the microseconds per call of each, the cache hit rate and the fallbacks to dateparser.
+
+usage: python benchmarks/bench_date_parse.py [--calls 20000] [--distinct 500]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_dates(calls, distinct, seed=0):
+    """
+    Returns calls date strings in the formats of the NASDAQ pages, drawn from distinct absolute dates.
+    """
+    rng = random.Random(seed)
+    first = datetime(2015, 1, 1, 6)
+    moments = [first + timedelta(minutes=rng.randrange(8 * 365 * 24 * 60)) for _ in range(distinct)]
+    formats = [lambda moment: moment.strftime("%b %d, %Y — %I:%M ") + moment.strftime("%p").lower()
+               + rng.choice([" EDT", " EST"]),
+               lambda moment: moment.strftime("%b %d, %Y"),
+               lambda moment: f"{rng.randrange(2, 24)} hours ago",
+               lambda moment: f"{rng.randrange(2, 60)} minutes ago",
+               lambda moment: "an hour ago"]
+    return [rng.choices(formats, weights=[6, 3, 1, 1, 0.2])[0](rng.choice(moments)) for _ in range(calls)]
+
+
+def time_parser(parse, dates):
+    """
+    Returns the microseconds per call of parse over the dates.
+    """
+    start = time.perf_counter()
+    for date in dates:
+        parse(date)
+    return (time.perf_counter() - start) / len(dates) * 1e6
+
+
+def same_date(expected, actual):
+    """
+    Returns True if both parsers agree: equal absolute dates, relative dates within a second of each other.
+    """
+    if expected is None or actual is None:
+        return expected is actual
+    if (expected.tzinfo is None) != (actual.tzinfo is None):
+        return False
+    if expected.tzinfo is not None and expected.utcoffset() != actual.utcoffset():
+        return False
+    return abs(expected - actual) < timedelta(seconds=1)
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='bench_date_parse', description='dateparser against NasdaqDateParser')
+    parser.add_argument('--calls', type=int, default=20000)
+    parser.add_argument('--distinct', type=int, default=500, help="different absolute dates among the calls")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    import dateparser
+    from Class_DateParser import NasdaqDateParser
+
+    dates = make_dates(args.calls, args.distinct)
+    dateparser.parse(dates[0])
+    baseline_us = time_parser(dateparser.parse, dates)
+    fast = NasdaqDateParser()
+    fast_us = time_parser(fast.parse, dates)
+    # compared back to back, so that the relative dates are computed from the same now
+    check = NasdaqDateParser()
+    mismatches = [date for date in sorted(set(dates)) if not same_date(dateparser.parse(date), check.parse(date))]
+    results = {'calls': args.calls, 'distinct': args.distinct,
+               'dateparser_us_per_call': baseline_us, 'fast_us_per_call': fast_us, 'speedup': baseline_us / fast_us,
+               'cache_hit_rate': fast.cache.hits / max(1, fast.cache.hits + fast.cache.misses),
+               'fallbacks': fast.fallbacks, 'mismatches': len(mismatches), 'mismatch_examples': mismatches[:5]}
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+"""
+Offline end-to-end benchmark of the scraper, parser, database and API stages.
+
+NASDAQ and Alpha Vantage are replaced by a local HTTP stand-in serving fixture pages and mock API responses, and the
+database by a scratch database on a local MySQL-compatible server (for example `docker run -p 3306:3306
+-e MYSQL_ROOT_PASSWORD=root mysql:8`). The fixture pages are synthetic NASDAQ-shaped pages, or the pages recorded in a
+raw HTML archive (see HTML_ARCHIVE in conf.json) with --archive.
+
+For every stage (fetch_articles_urls, setting_info, update_database, update_stock_prices) the harness reports its
+throughput and the peak RSS of the process once the stage is done, and saves the results as JSON.
+
+usage: python benchmarks/bench_pipeline.py run --pages 50 --db-password root [--archive DIR] [--output FILE]
+       python benchmarks/bench_pipeline.py compare BASELINE.json CANDIDATE.json
+"""
+import argparse
+import http.server
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import types
+from datetime import date, timedelta
+from urllib.parse import urlsplit, parse_qs
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MARKETS_PATH = "/news-and-insights/topic/markets/page/"
+CARDS_PER_PAGE = 20
+TICKERS = [f"T{i:03d}" for i in range(200)]
+TAGS = [f"Tag{i}" for i in range(50)]
+AUTHORS = [f"Author {i}" for i in range(40)]
+
+
+def listing_page(page):
+    """
+    Returns a synthetic NASDAQ markets listing page.
+    """
+    cards = "".join(f'<div class="content-feed__card"><a class="content-feed__card-title-link" '
+                    f'href="/articles/bench-{page}-{i}">Article {page}-{i}</a>'
+                    f'<div class="content-feed__card-timestamp">{i + 1} hours ago</div>'
+                    f'<div class="content-feed__card-timestamp">Markets</div></div>' for i in range(CARDS_PER_PAGE))
+    return f"<html><body><div class='content-feed'>{cards}</div></body></html>".encode('utf-8')
+
+
+def article_page(path):
+    """
+    Returns a synthetic NASDAQ article page, the same for the same path.
+    """
+    rng = random.Random(path)
+    paragraphs = "".join(f"<p>{' '.join(rng.choice(TAGS + TICKERS) for _ in range(60))}</p>" for _ in range(30))
+    tags = " ".join(f"<a>{tag}</a>" for tag in rng.sample(TAGS, 3))
+    tickers = " ".join(f"<a>{tick}</a>" for tick in rng.sample(TICKERS, 3))
+    return (f'<html><body><h1 class="jupiter22-c-hero-article-title">Title of {path}</h1>'
+            f'<span class="jupiter22-c-author-byline__author-no-link">{rng.choice(AUTHORS)}</span>'
+            f'<p class="jupiter22-c-author-byline__timestamp">May 05, 2023 10:32 am EDT</p>'
+            f'<div class="body">{paragraphs}</div>'
+            f'<div class="jupiter22-c-tags-container">{tags}</div>'
+            f'<div class="jupiter22-c-related-stocks-horizontal__list">{tickers}</div>'
+            f'</body></html>').encode('utf-8')
+
+
+def alpha_vantage_response(params):
+    """
+    Returns a mock Alpha Vantage json response for the query parameters.
+    """
+    symbol = params.get('symbol', 'UNKNOWN')
+    if params.get('function') == 'OVERVIEW':
+        return {'Symbol': symbol, 'Name': f'{symbol} Inc', 'Currency': 'USD', 'Country': 'USA',
+                'Sector': 'TECHNOLOGY', 'Industry': 'SOFTWARE'}
+    days = 100 if params.get('outputsize') == 'compact' else 1000
+    series = {}
+    for i in range(days):
+        price = 100 + i % 17
+        series[(date(2023, 5, 5) - timedelta(days=i)).isoformat()] = {
+            '1. open': f'{price:.4f}', '2. high': f'{price + 1:.4f}', '3. low': f'{price - 1:.4f}',
+            '4. close': f'{price + 0.5:.4f}', '5. adjusted close': f'{price + 0.5:.4f}', '6. volume': '12345678'}
+    return {'Meta Data': {'2. Symbol': symbol}, 'Time Series (Daily)': series}
+
+
+def make_handler(archive_pages):
+    """
+    Returns the request handler of the stand-in server, replaying archive_pages (path -> content) when given.
+    """
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            if url.path == "/query":
+                params = {key: values[0] for key, values in parse_qs(url.query).items()}
+                self._send(json.dumps(alpha_vantage_response(params)).encode('utf-8'), "application/json")
+            elif archive_pages is not None:
+                content = archive_pages.get(url.path)
+                if content is None:
+                    self.send_error(404)
+                else:
+                    self._send(content, "text/html")
+            elif url.path.startswith(MARKETS_PATH):
+                self._send(listing_page(int(url.path[len(MARKETS_PATH):])), "text/html")
+            else:
+                self._send(article_page(url.path), "text/html")
+
+        def _send(self, body, content_type):
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+def load_archive_pages(directory):
+    """
+    Returns a dict of url path -> content of the pages recorded in a raw HTML archive.
+    """
+    from Class_HtmlArchive import HtmlArchive, load_page
+    archive = HtmlArchive(directory)
+    pages = {}
+    for kind in ('listing', 'article'):
+        for url, digest in archive.pages(kind):
+            pages[urlsplit(url).path] = load_page(directory, digest)
+    archive.close()
+    return pages
+
+
+def count_rows(connection, tables):
+    """
+    Returns the total number of rows of the tables.
+    """
+    cursor = connection.cursor()
+    total = 0
+    for table in tables:
+        cursor.execute(f"SELECT COUNT(*) AS n FROM {table}")
+        total += cursor.fetchone()['n']
+    return total
+
+
+def run(args):
+    """
+    Runs every stage against the stand-in server and the scratch database and returns the results.
+    """
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    import gevent.monkey
+    gevent.monkey.patch_all()  # as the scraper does when run as a program
+    import pymysql.cursors
+    import NASDAQ_scraper
+    import NASDAQ_datacollecter
+    import API_datacollector
+    from Class_Metrics import peak_rss_mb
+    from NASDAQ_config import setup_logging
+    setup_logging("NASDAQ_scraper", "NASDAQ_datacollector", "API_datacollector", "NASDAQ_workqueue")
+
+    archive_pages = load_archive_pages(args.archive) if args.archive else None
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), make_handler(archive_pages))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    NASDAQ_scraper.config.update(NASDAQ_URL=base_url, INASDAQ_MARKETS_URL=f"{base_url}{MARKETS_PATH}")
+    NASDAQ_scraper.print = lambda *_: None  # the stages print every article
+    API_datacollector.config['API'].update(url=f"{base_url}/query", per_minute=10 ** 6, per_day=10 ** 6)
+    API_datacollector.config['API_CACHE'].update(dir=tempfile.mkdtemp(prefix="bench_api_cache"), offline=False)
+
+    connection = pymysql.connect(host=args.db_host, port=args.db_port, user=args.db_user,
+                                 password=args.db_password, cursorclass=pymysql.cursors.DictCursor)
+    cursor = connection.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{args.db_name}`")
+    cursor.execute(f"CREATE DATABASE `{args.db_name}`")
+    connection.select_db(args.db_name)
+    NASDAQ_datacollecter.create_database(NASDAQ_scraper.config["DB_COMMANDS_FILE"], connection)
+
+    results = {'started': time.strftime("%Y-%m-%dT%H:%M:%S"), 'pages': args.pages,
+               'fixtures': 'archive' if args.archive else 'synthetic', 'stages': {}}
+    crawl_args = types.SimpleNamespace(pages=args.pages, time=None, incremental=False)
+
+    start = time.perf_counter()
+    links = NASDAQ_scraper.fetch_articles_urls(crawl_args, connection)
+    elapsed = time.perf_counter() - start
+    results['stages']['fetch_articles_urls'] = {'seconds': elapsed, 'listing_pages_per_s': args.pages / elapsed,
+                                                'links': len(links), 'peak_rss_mb': peak_rss_mb()}
+
+    # setting_info is timed without its database writes, which are timed on their own below
+    parsed = []
+    update_database = NASDAQ_datacollecter.update_database
+    NASDAQ_datacollecter.update_database = lambda articles, _connection, overwrite=False: parsed.extend(articles)
+    start = time.perf_counter()
+    NASDAQ_scraper.setting_info(NASDAQ_scraper.get_articles(links), connection)
+    elapsed = time.perf_counter() - start
+    NASDAQ_datacollecter.update_database = update_database
+    results['stages']['setting_info'] = {'seconds': elapsed, 'articles_parsed_per_s': len(parsed) / elapsed,
+                                         'articles': len(parsed), 'peak_rss_mb': peak_rss_mb()}
+
+    article_tables = ("Authors", "Articles", "Tags", "Stocks", "Article_Tags", "Stock_Articles")
+    start = time.perf_counter()
+    batch_size = NASDAQ_scraper.config["INSERT"]
+    for i in range(0, len(parsed), batch_size):
+        NASDAQ_datacollecter.update_database(parsed[i:i + batch_size], connection)
+    elapsed = time.perf_counter() - start
+    rows = count_rows(connection, article_tables)
+    results['stages']['update_database'] = {'seconds': elapsed, 'db_rows_per_s': rows / elapsed, 'rows': rows,
+                                            'peak_rss_mb': peak_rss_mb()}
+
+    start = time.perf_counter()
+    API_datacollector.update_stock_prices(connection)
+    elapsed = time.perf_counter() - start
+    rows = count_rows(connection, ("Stocks_Prices",))
+    results['stages']['update_stock_prices'] = {'seconds': elapsed, 'db_rows_per_s': rows / elapsed, 'rows': rows,
+                                                'peak_rss_mb': peak_rss_mb()}
+
+    cursor.execute(f"DROP DATABASE `{args.db_name}`")
+    server.shutdown()
+    return results
+
+
+def compare(baseline_file, candidate_file):
+    """
+    Prints the throughput of every stage of two saved runs side by side.
+    """
+    with open(baseline_file) as file:
+        baseline = json.load(file)
+    with open(candidate_file) as file:
+        candidate = json.load(file)
+    for stage, metrics in baseline['stages'].items():
+        for metric, value in metrics.items():
+            if metric.endswith('_per_s') or metric == 'peak_rss_mb':
+                new_value = candidate['stages'].get(stage, {}).get(metric)
+                ratio = f"{new_value / value:.2f}x" if new_value and value else "n/a"
+                print(f"{stage:22} {metric:24} {value:12.1f} -> {new_value or 0:12.1f}  {ratio}")
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='bench_pipeline', description='offline benchmark of the NASDAQ pipeline')
+    commands = parser.add_subparsers(dest='command', required=True)
+    run_parser = commands.add_parser('run', help="run the benchmark and save the results")
+    run_parser.add_argument('--pages', type=int, default=50, help="number of listing pages to crawl")
+    run_parser.add_argument('--archive', help="raw HTML archive folder to replay instead of synthetic pages")
+    run_parser.add_argument('--db-host', default="127.0.0.1")
+    run_parser.add_argument('--db-port', type=int, default=3306)
+    run_parser.add_argument('--db-user', default="root")
+    run_parser.add_argument('--db-password', default="")
+    run_parser.add_argument('--db-name', default="nasdaq_bench", help="scratch database (dropped and created again)")
+    run_parser.add_argument('--output', help="results file, default benchmarks/results/<time>.json")
+    compare_parser = commands.add_parser('compare', help="compare two saved runs")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('candidate')
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        compare(args.baseline, args.candidate)
+        return
+    results = run(args)
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"{time.strftime('%Y%m%d-%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
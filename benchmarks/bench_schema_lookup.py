@@ -0,0 +1,116 @@
+"""
+Benchmark of the article and dimension lookups of NASDAQ_datacollecter, before and after the indexes added by
+migrations/002_unique_and_composite_indexes.sql, on a scratch database filled with 1M articles.
+
+usage: python benchmarks/bench_schema_lookup.py --db-password root [--db-host 127.0.0.1] [--database nasdaq_bench]
+       [--articles 1000000] [--lookups 1000]
+
+The scratch database is dropped and created again on a local MySQL-compatible server (for example `docker run
+-p 3306:3306 -e MYSQL_ROOT_PASSWORD=root mysql:8`); the benchmark refuses to use the database named in conf.json.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import time
+
+import pymysql.cursors
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+with open(os.path.join(ROOT, "conf.json")) as f:
+    config = json.load(f)
+
+TABLES = """
+CREATE TABLE `Articles_{suffix}` (
+  `article_id` INTEGER PRIMARY KEY AUTO_INCREMENT,
+  `url` varchar(255),
+  `url_hash` char(40)
+  {article_key}
+);
+CREATE TABLE `Tags_{suffix}` (
+  `tag_id` INTEGER PRIMARY KEY AUTO_INCREMENT,
+  `tag_name` varchar(255)
+  {tag_key}
+)
+"""
+
+
+def create_tables(cursor, suffix, indexed):
+    """
+    Creates the Articles and Tags benchmark tables, with the unique keys of the migrated schema if indexed.
+    """
+    article_key = ", UNIQUE KEY (`url_hash`)" if indexed else ""
+    tag_key = ", UNIQUE KEY (`tag_name`)" if indexed else ""
+    for query in TABLES.format(suffix=suffix, article_key=article_key, tag_key=tag_key).split(';'):
+        cursor.execute(query)
+
+
+def fill_tables(connection, suffix, articles, tags, batch_size=10000):
+    """
+    Inserts the benchmark articles and tags in multi-row batches.
+    """
+    cursor = connection.cursor()
+    for start in range(0, articles, batch_size):
+        urls = [f"https://www.nasdaq.com/articles/bench-{i}" for i in range(start, min(start + batch_size, articles))]
+        cursor.executemany(f"INSERT INTO Articles_{suffix} (url, url_hash) VALUES (%s, %s)",
+                           [(url, hashlib.sha1(url.encode('utf-8')).hexdigest()) for url in urls])
+        connection.commit()
+    cursor.executemany(f"INSERT INTO Tags_{suffix} (tag_name) VALUES (%s)", [(f"tag-{i}",) for i in range(tags)])
+    connection.commit()
+
+
+def time_lookups(cursor, query, params):
+    """
+    Returns the mean and p99 latency in milliseconds of running the query once per parameter.
+    """
+    latencies = []
+    for param in params:
+        start = time.perf_counter()
+        cursor.execute(query, (param,))
+        cursor.fetchall()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    return {'mean_ms': sum(latencies) / len(latencies), 'p99_ms': latencies[int(len(latencies) * 0.99) - 1]}
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='bench_schema_lookup',
+                                     description='lookup cost of the NASDAQ schema with and without its indexes')
+    parser.add_argument('--db-host', default="127.0.0.1")
+    parser.add_argument('--db-port', type=int, default=3306)
+    parser.add_argument('--db-user', default="root")
+    parser.add_argument('--db-password', default="")
+    parser.add_argument('--database', default="nasdaq_bench", help="scratch database (dropped and created again)")
+    parser.add_argument('--articles', type=int, default=1000000)
+    parser.add_argument('--tags', type=int, default=10000)
+    parser.add_argument('--lookups', type=int, default=1000)
+    args = parser.parse_args()
+    if args.database == config["DB"]:
+        parser.error(f"{args.database} is the database of conf.json, the benchmark needs a scratch database")
+
+    connection = pymysql.connect(host=args.db_host, port=args.db_port, user=args.db_user, password=args.db_password,
+                                 cursorclass=pymysql.cursors.DictCursor)
+    cursor = connection.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{args.database}`")
+    cursor.execute(f"CREATE DATABASE `{args.database}`")
+    cursor.execute(f"USE `{args.database}`")
+
+    urls = [f"https://www.nasdaq.com/articles/bench-{random.randrange(args.articles)}" for _ in range(args.lookups)]
+    tags = [f"tag-{random.randrange(args.tags)}" for _ in range(args.lookups)]
+    results = {'articles': args.articles, 'tags': args.tags, 'lookups': args.lookups}
+    for suffix, indexed in (('plain', False), ('indexed', True)):
+        create_tables(cursor, suffix, indexed)
+        fill_tables(connection, suffix, args.articles, args.tags)
+        results[suffix] = {
+            'article_by_url_hash': time_lookups(cursor, f"SELECT article_id FROM Articles_{suffix} WHERE url_hash = %s",
+                                                [hashlib.sha1(url.encode('utf-8')).hexdigest() for url in urls]),
+            'tag_by_name': time_lookups(cursor, f"SELECT tag_id FROM Tags_{suffix} WHERE tag_name = %s", tags),
+        }
+    cursor.execute(f"DROP DATABASE `{args.database}`")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
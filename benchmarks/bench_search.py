@@ -0,0 +1,130 @@
+"""
+Benchmark of the NASDAQ_search queries on a scratch database growing to millions of articles.
+
+The scratch database gets the full schema and migrations, and is filled in steps (--steps) with synthetic articles,
+each with 3 tickers and 3 tags; after every step the full-text, ticker, tag, date range and combined searches are
+timed, on their first page and on a later page reached by keyset pagination.
+
+usage: python benchmarks/bench_search.py --db-password root [--db-host 127.0.0.1] [--database nasdaq_bench]
+       [--steps 10000,100000,1000000] [--queries 100]
+
+The scratch database is dropped and created again on a local MySQL-compatible server (for example `docker run
+-p 3306:3306 -e MYSQL_ROOT_PASSWORD=root mysql:8`); the benchmark refuses to use the database named in conf.json.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORDS = [f"word{i}" for i in range(20000)]
+TICKERS = [f"T{i:04d}" for i in range(5000)]
+TAGS = [f"tag{i}" for i in range(500)]
+FIRST_DATE = datetime(2015, 1, 1)
+
+
+def fill_articles(connection, first, last, batch_size=5000):
+    """
+    Inserts the synthetic articles first to last - 1, with their ticker and tag links.
+    """
+    cursor = connection.cursor()
+    rng = random.Random(first)
+    for start in range(first, last, batch_size):
+        ids = range(start + 1, min(start + batch_size, last) + 1)
+        articles, stocks, tags = [], [], []
+        for article_id in ids:
+            url = f"https://www.nasdaq.com/articles/bench-{article_id}"
+            content = " ".join(rng.choices(WORDS, k=150))
+            published = FIRST_DATE + timedelta(minutes=article_id * 5)
+            articles.append((article_id, f"Title {' '.join(rng.choices(WORDS, k=8))}", content, url,
+                             hashlib.sha1(url.encode('utf-8')).hexdigest(), published))
+            stocks += [(stock_id, article_id) for stock_id in rng.sample(range(1, len(TICKERS) + 1), 3)]
+            tags += [(tag_id, article_id) for tag_id in rng.sample(range(1, len(TAGS) + 1), 3)]
+        cursor.executemany("INSERT INTO Articles (article_id, title, article_content, url, url_hash, published_date) "
+                           "VALUES (%s, %s, %s, %s, %s, %s)", articles)
+        cursor.executemany("INSERT INTO Stock_Articles (stock_id, article_id) VALUES (%s, %s)", stocks)
+        cursor.executemany("INSERT INTO Article_Tags (tag_id, article_id) VALUES (%s, %s)", tags)
+        connection.commit()
+
+
+def time_queries(connection, search_articles, queries, articles):
+    """
+    Returns the mean and p99 latency in milliseconds of every kind of search, on the first page and on the
+    third page.
+    """
+    rng = random.Random(articles)
+    last_date = FIRST_DATE + timedelta(minutes=articles * 5)
+    kinds = {
+        'text': lambda: {'text': rng.choice(WORDS)},
+        'phrase': lambda: {'text': " ".join(rng.choices(WORDS, k=2)), 'phrase': True},
+        'ticker': lambda: {'ticker': rng.choice(TICKERS)},
+        'tag': lambda: {'tag': rng.choice(TAGS)},
+        'date_range': lambda: {'start': last_date - timedelta(days=rng.randrange(1, 30)), 'end': last_date},
+        'ticker_and_text': lambda: {'ticker': rng.choice(TICKERS), 'text': rng.choice(WORDS)},
+    }
+    results = {}
+    for kind, make_filters in kinds.items():
+        for page in (1, 3):
+            latencies = []
+            for _ in range(queries):
+                filters = make_filters()
+                after = None
+                for _ in range(page - 1):
+                    after = search_articles(connection, after=after, **filters)['next']
+                start = time.perf_counter()
+                search_articles(connection, after=after, **filters)
+                latencies.append((time.perf_counter() - start) * 1000)
+            latencies.sort()
+            results[f"{kind}_page{page}"] = {'mean_ms': sum(latencies) / len(latencies),
+                                             'p99_ms': latencies[max(0, int(len(latencies) * 0.99) - 1)]}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='bench_search', description='search latency as the archive grows')
+    parser.add_argument('--db-host', default="127.0.0.1")
+    parser.add_argument('--db-port', type=int, default=3306)
+    parser.add_argument('--db-user', default="root")
+    parser.add_argument('--db-password', default="")
+    parser.add_argument('--database', default="nasdaq_bench", help="scratch database (dropped and created again)")
+    parser.add_argument('--steps', default="10000,100000,1000000", help="archive sizes to measure at")
+    parser.add_argument('--queries', type=int, default=100, help="queries per kind of search and size")
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    import pymysql.cursors
+    import NASDAQ_datacollecter
+    from NASDAQ_search import search_articles
+    config = NASDAQ_datacollecter.config
+    if args.database == config["DB"]:
+        parser.error(f"{args.database} is the database of conf.json, the benchmark needs a scratch database")
+
+    connection = pymysql.connect(host=args.db_host, port=args.db_port, user=args.db_user, password=args.db_password,
+                                 cursorclass=pymysql.cursors.DictCursor)
+    cursor = connection.cursor()
+    cursor.execute(f"DROP DATABASE IF EXISTS `{args.database}`")
+    cursor.execute(f"CREATE DATABASE `{args.database}`")
+    connection.select_db(args.database)
+    NASDAQ_datacollecter.create_database(config["DB_COMMANDS_FILE"], connection)
+    cursor.executemany("INSERT INTO Stocks (stock_tick) VALUES (%s)", [(tick,) for tick in TICKERS])
+    cursor.executemany("INSERT INTO Tags (tag_name) VALUES (%s)", [(tag,) for tag in TAGS])
+    connection.commit()
+
+    results = {}
+    articles = 0
+    for step in sorted(int(size) for size in args.steps.split(',')):
+        fill_articles(connection, articles, step)
+        articles = step
+        results[step] = time_queries(connection, search_articles, args.queries, articles)
+        print(json.dumps({step: results[step]}, indent=2))
+    cursor.execute(f"DROP DATABASE `{args.database}`")
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Startup benchmark of the program modules, measured with `python -X importtime`.
+
+Every module is imported in a fresh interpreter, which reports the import time of the module (with everything it
+imports) and its most expensive imports, the heavy libraries it loaded, whether it monkey patched the process and
+whether it opened a log file. With --check, exits with status 1 when a module loads a library it should only load
+on the code paths using it, patches the process or touches logs/, so it can guard the lazy imports in CI.
+
+usage: python benchmarks/bench_startup.py [--runs 5] [--check] [MODULE ...]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ["pandas", "numpy", "dateparser", "gevent", "grequests", "pyarrow", "bs4", "pymysql"]
+# libraries each module must not load when it is only imported
+LAZY = {
+    "NASDAQ_scraper": ["pandas", "dateparser", "gevent", "grequests"],
+    "NASDAQ_datacollecter": ["pandas", "numpy", "dateparser", "gevent", "grequests"],
+    "API_datacollector": ["pandas", "numpy", "dateparser", "gevent", "grequests"],
+    "NASDAQ_workqueue": ["pandas", "numpy", "dateparser", "gevent", "grequests"],
+    "NASDAQ_search": ["pandas", "numpy", "dateparser", "gevent", "grequests"],
+    "NASDAQ_analytics": ["pandas", "dateparser", "gevent", "grequests"],
+    "NASDAQ_export": ["dateparser", "gevent", "grequests"],
+}
+PROBE = """
+import json, os, sys, time
+logs = {{name: os.stat(os.path.join('logs', name)).st_mtime_ns for name in os.listdir('logs')}} \\
+    if os.path.isdir('logs') else {{}}
+start = time.perf_counter()
+import {module}
+seconds = time.perf_counter() - start
+monkey = sys.modules.get('gevent.monkey')
+touched = [name for name in os.listdir('logs') if logs.get(name) != os.stat(os.path.join('logs', name)).st_mtime_ns] \\
+    if os.path.isdir('logs') else []
+print(json.dumps({{'seconds': seconds, 'loaded': [name for name in {heavy} if name in sys.modules],
+                  'patched': bool(monkey and monkey.saved), 'logs_touched': touched}}))
+"""
+
+
+def import_times(stderr):
+    """
+    Returns the (self microseconds, cumulative microseconds, name) of every import in a -X importtime report.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        imports.append((int(self_us), int(cumulative_us), name.strip()))
+    return imports
+
+
+def measure(module, runs):
+    """
+    Returns the startup figures of a module: the best wall time of runs imports, its cumulative -X importtime,
+    its five most expensive imports, and what the import loaded or touched.
+    """
+    code = PROBE.format(module=module, heavy=HEAVY)
+    best = None
+    for _ in range(runs):
+        process = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True,
+                                 text=True)
+        if process.returncode:
+            raise RuntimeError(f"importing {module} failed:\n{process.stderr[-2000:]}")
+        probe = json.loads(process.stdout.splitlines()[-1])
+        if best is None or probe['seconds'] < best[0]['seconds']:
+            best = probe, import_times(process.stderr)
+    probe, imports = best
+    cumulative = next((cumulative_us for _, cumulative_us, name in imports if name == module), 0)
+    slowest = sorted(imports, reverse=True)[:5]
+    return {'import_ms': probe['seconds'] * 1000, 'importtime_ms': cumulative / 1000,
+            'slowest_self_ms': {name: self_us / 1000 for self_us, _, name in slowest},
+            'loaded': probe['loaded'], 'patched': probe['patched'], 'logs_touched': probe['logs_touched']}
+
+
+def problems(module, result):
+    """
+    Returns the startup side effects of a module that the lazy imports should have avoided.
+    """
+    found = [f"loads {name}" for name in LAZY.get(module, []) if name in result['loaded']]
+    if result['patched']:
+        found.append("monkey patches the process")
+    if result['logs_touched']:
+        found.append(f"touches {', '.join(result['logs_touched'])}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(prog='bench_startup', description='import time of the program modules')
+    parser.add_argument('modules', nargs='*', default=list(LAZY), help="modules to import (default: all)")
+    parser.add_argument('--runs', type=int, default=5, help="imports per module, the fastest is kept")
+    parser.add_argument('--check', action='store_true', help="exit with status 1 on an import side effect")
+    args = parser.parse_args()
+
+    results = {module: measure(module, args.runs) for module in args.modules}
+    failures = {module: problems(module, result) for module, result in results.items() if problems(module, result)}
+    print(json.dumps(results, indent=2))
+    for module, found in failures.items():
+        print(f"{module}: {'; '.join(found)}", file=sys.stderr)
+    if args.check and failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,17 @@
+-- Unique url hash for de-duplicating articles, and the crawl high-water mark.
+
+ALTER TABLE `Articles` ADD COLUMN `url_hash` char(40) AFTER `url`;
+
+UPDATE `Articles` SET `url_hash` = SHA1(`url`) WHERE `url_hash` IS NULL;
+
+-- keeps the first copy of every url, so the unique key can be added
+DELETE a FROM `Articles` a JOIN `Articles` b
+  ON a.`url_hash` = b.`url_hash` AND a.`article_id` > b.`article_id`;
+
+ALTER TABLE `Articles` ADD UNIQUE KEY `UQ_Articles_url_hash` (`url_hash`);
+
+CREATE TABLE IF NOT EXISTS `Crawl_State` (
+  `state_key` varchar(64) PRIMARY KEY,
+  `url` varchar(255),
+  `published_date` datetime
+);
@@ -0,0 +1,61 @@
+-- Unique names for the dimension tables and composite keys for the link tables, so the write paths can upsert
+-- instead of select-insert-select. Duplicates left by the old write paths are merged first.
+
+UPDATE `Articles` a
+  JOIN `Authors` d ON a.`author_id` = d.`author_id`
+  JOIN (SELECT `author_name`, MIN(`author_id`) AS keep_id FROM `Authors` GROUP BY `author_name`) k
+    ON k.`author_name` = d.`author_name`
+  SET a.`author_id` = k.keep_id
+  WHERE a.`author_id` <> k.keep_id;
+
+DELETE d FROM `Authors` d JOIN `Authors` k
+  ON d.`author_name` = k.`author_name` AND d.`author_id` > k.`author_id`;
+
+ALTER TABLE `Authors` ADD UNIQUE KEY `UQ_Authors_author_name` (`author_name`);
+
+UPDATE `Article_Tags` t
+  JOIN `Tags` d ON t.`tag_id` = d.`tag_id`
+  JOIN (SELECT `tag_name`, MIN(`tag_id`) AS keep_id FROM `Tags` GROUP BY `tag_name`) k
+    ON k.`tag_name` = d.`tag_name`
+  SET t.`tag_id` = k.keep_id
+  WHERE t.`tag_id` <> k.keep_id;
+
+DELETE d FROM `Tags` d JOIN `Tags` k
+  ON d.`tag_name` = k.`tag_name` AND d.`tag_id` > k.`tag_id`;
+
+ALTER TABLE `Tags` ADD UNIQUE KEY `UQ_Tags_tag_name` (`tag_name`);
+
+UPDATE `Stock_Articles` s
+  JOIN `Stocks` d ON s.`stock_id` = d.`stock_id`
+  JOIN (SELECT `stock_tick`, MIN(`stock_id`) AS keep_id FROM `Stocks` GROUP BY `stock_tick`) k
+    ON k.`stock_tick` = d.`stock_tick`
+  SET s.`stock_id` = k.keep_id
+  WHERE s.`stock_id` <> k.keep_id;
+
+UPDATE `Stocks_Prices` p
+  JOIN `Stocks` d ON p.`stock_id` = d.`stock_id`
+  JOIN (SELECT `stock_tick`, MIN(`stock_id`) AS keep_id FROM `Stocks` GROUP BY `stock_tick`) k
+    ON k.`stock_tick` = d.`stock_tick`
+  SET p.`stock_id` = k.keep_id
+  WHERE p.`stock_id` <> k.keep_id;
+
+DELETE d FROM `Stocks` d JOIN `Stocks` k
+  ON d.`stock_tick` = k.`stock_tick` AND d.`stock_id` > k.`stock_id`;
+
+ALTER TABLE `Stocks` ADD UNIQUE KEY `UQ_Stocks_stock_tick` (`stock_tick`);
+
+DELETE a FROM `Article_Tags` a JOIN `Article_Tags` b
+  ON a.`article_id` = b.`article_id` AND a.`tag_id` = b.`tag_id` AND a.`article_tag_id` > b.`article_tag_id`;
+
+ALTER TABLE `Article_Tags` ADD UNIQUE KEY `UQ_Article_Tags_article_tag` (`article_id`, `tag_id`);
+
+DELETE a FROM `Stock_Articles` a JOIN `Stock_Articles` b
+  ON a.`stock_id` = b.`stock_id` AND a.`article_id` = b.`article_id`
+  AND a.`stock_article_id` > b.`stock_article_id`;
+
+ALTER TABLE `Stock_Articles` ADD UNIQUE KEY `UQ_Stock_Articles_stock_article` (`stock_id`, `article_id`);
+
+DELETE a FROM `Stocks_Prices` a JOIN `Stocks_Prices` b
+  ON a.`stock_id` = b.`stock_id` AND a.`date` = b.`date` AND a.`stock_price_id` > b.`stock_price_id`;
+
+ALTER TABLE `Stocks_Prices` ADD UNIQUE KEY `UQ_Stocks_Prices_stock_date` (`stock_id`, `date`);
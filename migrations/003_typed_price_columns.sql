@@ -0,0 +1,8 @@
+-- Prices were stored as int, which truncated them, and volume overflowed int on heavily traded stocks.
+
+ALTER TABLE `Stocks_Prices`
+  MODIFY `open` DECIMAL(18, 4),
+  MODIFY `high` DECIMAL(18, 4),
+  MODIFY `low` DECIMAL(18, 4),
+  MODIFY `close` DECIMAL(18, 4),
+  MODIFY `volume` BIGINT;
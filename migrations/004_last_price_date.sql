@@ -0,0 +1,10 @@
+-- Per-stock price watermark, so update_stock_prices plans from Stocks instead of scanning Stocks_Prices.
+
+ALTER TABLE `Stocks` ADD COLUMN `last_price_date` date;
+
+UPDATE `Stocks` s
+  JOIN (SELECT `stock_id`, DATE(MAX(`date`)) AS last_date FROM `Stocks_Prices` GROUP BY `stock_id`) p
+    ON p.`stock_id` = s.`stock_id`
+  SET s.`last_price_date` = p.last_date;
+
+ALTER TABLE `Stocks` ADD KEY `IX_Stocks_last_price_date` (`last_price_date`);
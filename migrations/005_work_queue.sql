@@ -0,0 +1,15 @@
+-- Work queue of the sharded crawl: listing page ranges and article urls claimed by workers with a lease.
+
+CREATE TABLE IF NOT EXISTS `Work_Queue` (
+  `item_id` INTEGER PRIMARY KEY AUTO_INCREMENT,
+  `kind` varchar(16) NOT NULL,
+  `payload` varchar(255) NOT NULL,
+  `payload_hash` char(40) NOT NULL,
+  `state` varchar(16) NOT NULL DEFAULT 'pending',
+  `lease_owner` varchar(128),
+  `lease_expires` datetime,
+  `attempts` INTEGER NOT NULL DEFAULT 0,
+  `updated_at` datetime DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  UNIQUE KEY `UQ_Work_Queue_item` (`kind`, `payload_hash`),
+  KEY `IX_Work_Queue_claim` (`state`, `lease_expires`)
+);
@@ -0,0 +1,9 @@
+-- Indexes of the search queries: full-text over title and content, and article ids ordered by ticker, tag and date.
+
+ALTER TABLE `Articles` ADD FULLTEXT KEY `FT_Articles_title_content` (`title`, `article_content`);
+
+ALTER TABLE `Articles` ADD KEY `IX_Articles_published_date` (`published_date`, `article_id`);
+
+ALTER TABLE `Article_Tags` ADD KEY `IX_Article_Tags_tag_article` (`tag_id`, `article_id`);
+
+ALTER TABLE `Stock_Articles` ADD KEY `IX_Stock_Articles_article_stock` (`article_id`, `stock_id`);
@@ -0,0 +1,189 @@
+"""
+Tests of the Alpha Vantage client of API_datacollector against a local mock Alpha Vantage server.
+
+run from the repository folder: python -m pytest tests
+"""
+import http.server
+import json
+import os
+import sys
+import threading
+from urllib.parse import urlsplit, parse_qs
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)  # the modules read conf.json from the working directory
+sys.path.insert(0, ROOT)
+import API_datacollector  # noqa: E402
+
+SERIES = {'2023-05-05': {'1. open': '101.0000', '2. high': '102.0000', '3. low': '100.0000', '4. close': '101.5000',
+                         '5. adjusted close': '101.5000', '6. volume': '1000'},
+          '2023-05-04': {'1. open': '100.0000', '2. high': '101.0000', '3. low': '99.0000', '4. close': '100.5000',
+                         '5. adjusted close': '100.5000', '6. volume': '2000'}}
+
+
+def alpha_vantage_response(params):
+    """
+    Returns the mock response of the query parameters; the symbol THROTTLED gets the throttle message, INVALID an
+    error message and the overview of PARTIAL has no Currency, Country, Sector and Industry.
+    """
+    if params['symbol'] == 'THROTTLED':
+        return {'Note': 'Thank you for using Alpha Vantage! Our standard API call frequency is 5 calls per minute.'}
+    if params['symbol'] == 'INVALID':
+        return {'Error Message': 'Invalid API call. Please retry or visit the documentation for OVERVIEW.'}
+    if params['function'] == 'OVERVIEW':
+        overview = {'Symbol': params['symbol'], 'Name': f"{params['symbol']} Inc"}
+        if params['symbol'] != 'PARTIAL':
+            overview.update({'Currency': 'USD', 'Country': 'USA', 'Sector': 'TECHNOLOGY', 'Industry': 'SOFTWARE'})
+        return overview
+    return {'Meta Data': {'2. Symbol': params['symbol']}, 'Time Series (Daily)': SERIES}
+
+
+@pytest.fixture(scope="module")
+def server():
+    """
+    Runs the mock Alpha Vantage server and yields its url and the list of the query parameters it received.
+    """
+    received = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            params = {key: values[0] for key, values in parse_qs(urlsplit(self.path).query).items()}
+            received.append(params)
+            body = json.dumps(alpha_vantage_response(params)).encode('utf-8')
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    mock = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=mock.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{mock.server_port}/query", received
+    mock.shutdown()
+
+
+@pytest.fixture
+def api(server, tmp_path, monkeypatch):
+    """
+    Points API_datacollector at the mock server, with an empty response cache and a daily quota of 3 calls.
+    Yields the list of the query parameters the server received.
+    """
+    url, received = server
+    received.clear()
+    monkeypatch.setitem(API_datacollector.config['API'], 'url', url)
+    monkeypatch.setitem(API_datacollector.config['API'], 'per_minute', 1000)
+    monkeypatch.setitem(API_datacollector.config['API'], 'per_day', 3)
+    monkeypatch.setitem(API_datacollector.config['API_CACHE'], 'dir', str(tmp_path))
+    monkeypatch.setitem(API_datacollector.config['API_CACHE'], 'offline', False)
+    monkeypatch.setattr(API_datacollector, 'limiters', {})
+    monkeypatch.setattr(API_datacollector, 'response_cache', None)
+    yield received
+
+
+def test_responses_are_cached(api):
+    first = API_datacollector.call_api({'function': 'OVERVIEW', 'symbol': 'AAPL'}, 'token')
+    second = API_datacollector.call_api({'function': 'OVERVIEW', 'symbol': 'AAPL'}, 'token')
+    assert first == second
+    assert first['Name'] == 'AAPL Inc'
+    assert len(api) == 1
+    assert api[0]['apikey'] == 'token'
+
+
+def test_throttled_call_raises_and_is_not_cached(api):
+    for _ in range(2):
+        with pytest.raises(API_datacollector.ThrottledError):
+            API_datacollector.call_api({'function': 'OVERVIEW', 'symbol': 'THROTTLED'}, 'token')
+    assert len(api) == 2
+
+
+def test_daily_quota_carries_over_to_the_next_run(api, monkeypatch):
+    for symbol in ('A', 'B'):
+        API_datacollector.call_api({'function': 'OVERVIEW', 'symbol': symbol}, 'token')
+    # a new run starts with new limiters and reads the quota the key already spent
+    monkeypatch.setattr(API_datacollector, 'limiters', {})
+    API_datacollector.call_api({'function': 'OVERVIEW', 'symbol': 'C'}, 'token')
+    with pytest.raises(API_datacollector.QuotaSpentError):
+        API_datacollector.call_api({'function': 'OVERVIEW', 'symbol': 'D'}, 'token')
+    assert [params['symbol'] for params in api] == ['A', 'B', 'C']
+    # the other key has its own quota
+    API_datacollector.call_api({'function': 'OVERVIEW', 'symbol': 'D'}, 'other token')
+
+
+def test_offline_mode_replays_the_cache(api):
+    API_datacollector.call_api({'function': 'OVERVIEW', 'symbol': 'AAPL'}, 'token')
+    API_datacollector.set_offline()
+    assert API_datacollector.call_api({'function': 'OVERVIEW', 'symbol': 'AAPL'}, 'token')['Name'] == 'AAPL Inc'
+    with pytest.raises(API_datacollector.CacheMissError):
+        API_datacollector.call_api({'function': 'OVERVIEW', 'symbol': 'MSFT'}, 'token')
+    assert len(api) == 1
+
+
+def test_offline_mode_replays_expired_responses(api, monkeypatch):
+    API_datacollector.call_api({'function': 'OVERVIEW', 'symbol': 'AAPL'}, 'token')
+    monkeypatch.setattr(API_datacollector.time, 'time', lambda: 4102444800)  # 2100, every response has expired
+    API_datacollector.set_offline()
+    assert API_datacollector.call_api({'function': 'OVERVIEW', 'symbol': 'AAPL'}, 'token')['Name'] == 'AAPL Inc'
+    # online, the expired response is fetched again
+    API_datacollector.set_offline(False)
+    API_datacollector.call_api({'function': 'OVERVIEW', 'symbol': 'AAPL'}, 'token')
+    assert len(api) == 2
+
+
+def test_price_series_become_price_rows(api):
+    prices = API_datacollector.call_price_stocks_api('AAPL')
+    assert api[0]['function'] == 'TIME_SERIES_DAILY_ADJUSTED'
+    assert api[0]['outputsize'] == 'compact'
+    rows = sorted(API_datacollector.price_rows(prices, 7), key=lambda row: row[1])
+    assert [(row[0], row[1].date().isoformat(), row[5], row[6]) for row in rows] == [
+        (7, '2023-05-04', 100.5, 2000), (7, '2023-05-05', 101.5, 1000)]
+
+
+class FakeConnection:
+    """
+    Records the parameters of the executemany calls instead of running them.
+    """
+
+    def __init__(self):
+        self.rows = []
+
+    def cursor(self):
+        """
+        Returns the connection itself, which stands in for its cursor.
+        """
+        return self
+
+    def executemany(self, query, rows):
+        self.rows.extend(rows)
+
+    def commit(self):
+        pass
+
+
+def test_info_without_symbol_is_skipped(api):
+    assert API_datacollector.call_info_stocks_api('INVALID').empty
+
+
+def test_missing_info_fields_are_stored_as_null(api):
+    connection = FakeConnection()
+    info = API_datacollector.call_info_stocks_api('PARTIAL')
+    API_datacollector.update_stocks(info, connection)
+    info = API_datacollector.call_info_stocks_api('AAPL')
+    API_datacollector.update_stocks(info, connection)
+    assert connection.rows == [('PARTIAL Inc', None, None, None, None, 'PARTIAL'),
+                               ('AAPL Inc', 'USD', 'USA', 'TECHNOLOGY', 'SOFTWARE', 'AAPL')]
+
+
+def test_queue_goes_on_after_a_store_failure(api):
+    stored = []
+
+    def store(ticker, result):
+        if ticker == 'B':
+            raise KeyError('Name')
+        stored.append(result)
+    API_datacollector.run_api_queue(['A', 'B', 'C'], 'token', str.lower, store)
+    assert stored == ['a', 'c']
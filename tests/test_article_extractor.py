@@ -0,0 +1,86 @@
+"""
+Tests of the single-pass article extractor of Class_Article against the extractor it replaced, on fixture article pages
+modelled on the NASDAQ article markup, malformed ones included.
+
+run from the repository folder: python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+from bs4 import BeautifulSoup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from Class_Article import Article, parse_article_html  # noqa: E402
+
+FIXTURES = os.path.join(ROOT, "tests", "fixtures", "articles")
+PAGES = sorted(name for name in os.listdir(FIXTURES) if name.endswith(".html"))
+
+
+def baseline_info(content):
+    """
+    Returns the article information as the original extractor got it: a full html.parser tree and one soup.find per
+    field.
+    """
+    soup = BeautifulSoup(content, "html.parser")
+    title_block = soup.find('h1', {'class': "jupiter22-c-hero-article-title"})
+    author_block = soup.find('span', {"class": "jupiter22-c-author-byline__author-no-link"})
+    time_stamp_block = soup.find('p', {"class": "jupiter22-c-author-byline__timestamp"})
+    tags_block = soup.find('div', {"class": "jupiter22-c-tags-container"})
+    tickers_block = soup.find('div', {"class": "jupiter22-c-related-stocks-horizontal__list"})
+    return {'title': title_block.get_text().strip() if title_block else None,
+            'author': author_block.get_text().strip() if author_block else "Unknown",
+            'date': time_stamp_block.get_text().strip() if time_stamp_block else "Unknown",
+            'tags': tags_block.get_text(" ").split() if tags_block else ["Unknown"],
+            'article_content': "\n".join([p.get_text() for p in soup.find_all('p')]),
+            'tickers': tickers_block.get_text(" ").split() if tickers_block else [],
+            }
+
+
+def read_page(name):
+    """
+    Returns the raw bytes of a fixture page, as the scraper gets them from response.content.
+    """
+    with open(os.path.join(FIXTURES, name), 'rb') as file:
+        return file.read()
+
+
+@pytest.mark.parametrize("name", PAGES)
+def test_extractor_matches_the_baseline(name):
+    content = read_page(name)
+    info = parse_article_html(content)
+    assert info.pop('parse_seconds') >= 0
+    assert info == baseline_info(content)
+
+
+@pytest.mark.parametrize("name", PAGES)
+def test_set_info_matches_parse_article_html(name):
+    content = read_page(name)
+    article = Article(1, "https://www.nasdaq.com/articles/" + name)
+    article.set_info(BeautifulSoup(content, "html.parser"))
+    info = parse_article_html(content)
+    assert article.row_info() == {'id': 1, 'title': info['title'], 'author': info['author'], 'date': info['date'],
+                                  'tags': info['tags'], 'tickers': info['tickers'],
+                                  'article_content': info['article_content'], 'url': article.url}
+
+
+def test_stray_end_tag_closes_the_open_paragraph():
+    content = '<div class="body"><p>Para one</div><div class="x">Footer text</div><p>Other</p>'
+    assert parse_article_html(content)['article_content'] == 'Para one\nOther'
+
+
+def test_well_formed_page_fields():
+    info = parse_article_html(read_page("well_formed.html"))
+    assert info['title'] == "Apple Earnings Beat Estimates as Services Revenue Hits a Record"
+    assert info['author'] == "Zacks Equity Research"
+    assert info['date'] == "May 05, 2023 — 10:32 am EDT"
+    assert info['tags'] == ["Earnings", "Technology"]
+    assert info['tickers'] == ["AAPL", "MSFT"]
+    assert "not a paragraph" not in info['article_content']
+
+
+def test_missing_fields_get_the_defaults():
+    info = parse_article_html(read_page("missing_fields.html"))
+    assert (info['title'], info['author'], info['date'], info['tags'], info['tickers']) == \
+           (None, "Unknown", "Unknown", ["Unknown"], [])
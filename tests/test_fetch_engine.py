@@ -0,0 +1,167 @@
+"""
+Tests of the adaptive SessionEngine of Class_FetchEngine against a local server that throttles on demand.
+
+run from the repository folder: python -m pytest tests
+"""
+import http.server
+import os
+import sys
+import threading
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import gevent
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+import Class_FetchEngine  # noqa: E402
+from Class_FetchEngine import AimdController, SessionEngine, retry_after  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def server():
+    """
+    Runs the throttling server and yields its url, the dict of path -> list of (status, headers) it answers the
+    next requests of a path with (200 once the list is empty), and the list of the paths it received.
+    """
+    scripts = {}
+    received = []
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            received.append(self.path)
+            status, headers = scripts[self.path].pop(0) if scripts.get(self.path) else (200, {})
+            body = f"<html><body>{self.path}</body></html>".encode('utf-8')
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    mock = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=mock.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{mock.server_port}", scripts, received
+    mock.shutdown()
+
+
+@pytest.fixture
+def throttling(server, monkeypatch):
+    """
+    Clears the server scripts and records the back-off sleeps of the engine instead of sleeping.
+    Yields the server url, its scripts, the paths it received and the list of the sleeps.
+    """
+    url, scripts, received = server
+    scripts.clear()
+    received.clear()
+    sleeps = []
+    monkeypatch.setattr(gevent, 'sleep', sleeps.append)
+    yield url, scripts, received, sleeps
+
+
+def make_test_engine(retries=2):
+    """
+    Returns a SessionEngine with a short back-off base and a 60 seconds back-off maximum.
+    """
+    return SessionEngine("test-agent", 5, 4, 4, retries=retries, backoff_base=0.01, backoff_max=60.0)
+
+
+def test_aimd_cuts_the_limit_once_per_cooldown(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(Class_FetchEngine.time, 'monotonic', lambda: now[0])
+    controller = AimdController(16, 2, 32, latency_target=1.0, decrease=0.5, cooldown=1.0)
+    controller.on_congestion()
+    controller.on_congestion()
+    assert controller.limit == 8
+    now[0] += 1.0
+    controller.on_congestion()
+    assert controller.limit == 4
+    for _ in range(3):
+        now[0] += 1.0
+        controller.on_congestion()
+    assert controller.limit == 2
+
+
+def test_aimd_grows_by_about_one_per_window_of_fast_responses():
+    controller = AimdController(4, 1, 6, latency_target=1.0)
+    for _ in range(4):
+        controller.on_success(0.1)
+    assert 4.9 < controller.limit < 5.1
+    controller.on_success(2.0)
+    assert 4.9 < controller.limit < 5.1
+    for _ in range(100):
+        controller.on_success(0.1)
+    assert controller.limit == 6
+
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_get_retries_throttled_and_failed_responses(throttling, status):
+    url, scripts, received, sleeps = throttling
+    scripts['/page'] = [(status, {}), (status, {})]
+    engine = make_test_engine()
+    response = engine.get(url + '/page')
+    assert response.status_code == 200
+    assert received == ['/page'] * 3
+    assert len(sleeps) == 2
+    assert engine.failed_urls == []
+    assert engine.controller.limit < 4
+
+
+def test_get_honours_retry_after_in_seconds(throttling):
+    url, scripts, received, sleeps = throttling
+    scripts['/page'] = [(429, {'Retry-After': '7'})]
+    assert make_test_engine().get(url + '/page').status_code == 200
+    assert sleeps == [7.0]
+
+
+def test_get_honours_retry_after_as_an_http_date(throttling):
+    url, scripts, received, sleeps = throttling
+    later = datetime.now(timezone.utc) + timedelta(seconds=30)
+    scripts['/page'] = [(503, {'Retry-After': format_datetime(later, usegmt=True)})]
+    assert make_test_engine().get(url + '/page').status_code == 200
+    assert len(sleeps) == 1 and 25 < sleeps[0] <= 30
+
+
+def test_retry_after_is_capped_by_backoff_max(throttling):
+    url, scripts, received, sleeps = throttling
+    scripts['/page'] = [(429, {'Retry-After': '3600'})]
+    make_test_engine().get(url + '/page')
+    assert sleeps == [60.0]
+
+
+def test_retry_after_parsing():
+    def response(value):
+        return SimpleNamespace(headers={'Retry-After': value} if value is not None else {})
+    assert retry_after(response('12')) == 12.0
+    assert retry_after(response('-5')) == 0.0
+    assert retry_after(response('Wed, 21 Oct 2015 07:28:00 GMT')) == 0.0
+    assert retry_after(response('soon')) is None
+    assert retry_after(response(None)) is None
+    assert retry_after(None) is None
+
+
+def test_failed_urls_after_every_retry(throttling):
+    url, scripts, received, sleeps = throttling
+    scripts['/down'] = [(503, {})] * 3
+    engine = make_test_engine()
+    responses = engine.map([url + '/up', url + '/down'])
+    assert [response.status_code for response in responses] == [200, 503]
+    assert received.count('/down') == 3
+    assert engine.failed_urls == [url + '/down']
+
+
+def test_unreachable_urls_are_failed_urls(throttling):
+    url, scripts, received, sleeps = throttling
+    # nothing listens on port 9 (discard) of the loopback interface
+    unreachable = "http://127.0.0.1:9/page"
+    engine = make_test_engine(retries=1)
+    assert [response.status_code for response in engine.imap([url + '/up', unreachable])] == [200]
+    assert engine.failed_urls == [unreachable]
+    assert engine.map([unreachable]) == [None]
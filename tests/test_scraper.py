@@ -0,0 +1,126 @@
+"""
+Tests of the listing page scraping and of the work queue worker of NASDAQ_scraper.
+
+run from the repository folder: python -m pytest tests
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(ROOT)  # the modules read conf.json from the working directory
+sys.path.insert(0, ROOT)
+import NASDAQ_scraper  # noqa: E402
+
+
+def listing_response(dates):
+    """
+    Returns a fake listing response with one card per published date, shaped as the NASDAQ markets listing: a title
+    link and two timestamp blocks per card.
+    """
+    cards = "".join(f'<div class="content-feed__card"><a class="content-feed__card-title-link" '
+                    f'href="/articles/{i}">Article {i}</a>'
+                    f'<div class="content-feed__card-timestamp">{published}</div>'
+                    f'<div class="content-feed__card-timestamp">Markets</div></div>'
+                    for i, published in enumerate(dates))
+    return SimpleNamespace(text=f"<html><body>{cards}</body></html>")
+
+
+def article_urls(*numbers):
+    """
+    Returns the article urls scrape_page builds for the cards of a fake listing response.
+    """
+    return [f"{NASDAQ_scraper.config['NASDAQ_URL']}/articles/{i}" for i in numbers]
+
+
+def test_cutoff_keeps_the_articles_newer_than_the_time_filter():
+    response = listing_response(["May 10, 2023", "May 07, 2023", "May 06, 2023"])
+    args = SimpleNamespace(time=datetime(2023, 5, 9) - timedelta(hours=6))
+    assert NASDAQ_scraper.scrape_page(response, args) == (True, article_urls(0))
+
+
+def test_cutoff_on_the_first_card_keeps_nothing():
+    response = listing_response(["May 07, 2023", "May 06, 2023", "May 05, 2023"])
+    args = SimpleNamespace(time=datetime(2023, 5, 9))
+    assert NASDAQ_scraper.scrape_page(response, args) == (True, [])
+
+
+def test_no_cutoff_keeps_the_page():
+    response = listing_response(["May 10, 2023", "May 09, 2023", "May 08, 2023", "May 07, 2023"])
+    args = SimpleNamespace(time=datetime(2023, 5, 1))
+    assert NASDAQ_scraper.scrape_page(response, args) == (False, article_urls(0, 1, 2))
+    assert NASDAQ_scraper.scrape_page(response, SimpleNamespace(time=None)) == (False, article_urls(0, 1, 2))
+
+
+class FakeQueue:
+    """
+    Stands in for the work queue functions: hands out the claims in order and records the completed and released
+    item ids.
+    """
+
+    def __init__(self, monkeypatch, claims):
+        self.claims = list(claims)
+        self.completed, self.released = [], []
+        monkeypatch.setattr(NASDAQ_scraper.NASDAQ_workqueue, 'claim_items', self.claim_items)
+        monkeypatch.setattr(NASDAQ_scraper.NASDAQ_workqueue, 'queue_is_finished', lambda connection: True)
+        monkeypatch.setattr(NASDAQ_scraper.NASDAQ_workqueue, 'complete_items',
+                            lambda item_ids, owner, connection: self.completed.extend(item_ids))
+        monkeypatch.setattr(NASDAQ_scraper.NASDAQ_workqueue, 'release_items',
+                            lambda item_ids, owner, connection: self.released.extend(item_ids))
+
+    def claim_items(self, owner, connection):
+        """
+        Returns the next claim, or no items once they are all handed out.
+        """
+        return self.claims.pop(0) if self.claims else []
+
+
+def claimed_items():
+    """
+    Returns the items of one claim: a listing range and two articles.
+    """
+    return [{'item_id': 1, 'kind': 'listing', 'payload': '1-10'},
+            {'item_id': 2, 'kind': 'article', 'payload': 'https://www.nasdaq.com/articles/a'},
+            {'item_id': 3, 'kind': 'article', 'payload': 'https://www.nasdaq.com/articles/b'}]
+
+
+def failing_setting_info(error):
+    """
+    Returns a setting_info stand-in that raises the error on its first call and stores nothing afterwards.
+    """
+    calls = []
+
+    def setting_info(articles, connection):
+        calls.append(articles)
+        if len(calls) == 1:
+            raise error
+    return setting_info
+
+
+def test_worker_releases_the_items_and_carries_on_after_a_deadlock(monkeypatch):
+    queue = FakeQueue(monkeypatch, [claimed_items(), claimed_items()])
+    monkeypatch.setattr(NASDAQ_scraper, 'process_listing_range', lambda args, item, connection: True)
+    monkeypatch.setattr(NASDAQ_scraper, 'setting_info', failing_setting_info(
+        NASDAQ_scraper.pymysql.err.OperationalError(1213, 'Deadlock found when trying to get lock')))
+    monkeypatch.setattr(NASDAQ_scraper.NASDAQ_datacollecter, 'get_existing_urls',
+                        lambda urls, connection: {'https://www.nasdaq.com/articles/a'})
+    connection = SimpleNamespace(rollback=lambda: None)
+    NASDAQ_scraper.run_queue_worker(SimpleNamespace(time=None), connection)
+    # the first claim: the listing range was done before the deadlock, the articles are released
+    # the second claim: the listing range and the stored article are done, the other article is released
+    assert queue.completed == [1, 1, 2]
+    assert queue.released == [2, 3, 3]
+
+
+def test_worker_releases_the_items_before_raising_other_errors(monkeypatch):
+    queue = FakeQueue(monkeypatch, [claimed_items(), claimed_items()])
+    monkeypatch.setattr(NASDAQ_scraper, 'process_listing_range', lambda args, item, connection: True)
+    monkeypatch.setattr(NASDAQ_scraper, 'setting_info', failing_setting_info(
+        NASDAQ_scraper.pymysql.err.IntegrityError(1062, 'Duplicate entry')))
+    connection = SimpleNamespace(rollback=lambda: None)
+    with pytest.raises(NASDAQ_scraper.pymysql.err.IntegrityError):
+        NASDAQ_scraper.run_queue_worker(SimpleNamespace(time=None), connection)
+    assert (queue.completed, queue.released) == ([1], [2, 3])
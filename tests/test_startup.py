@@ -0,0 +1,21 @@
+"""
+Tests that importing the program modules loads none of the libraries they import lazily, does not monkey patch the
+process and does not touch logs/, measured with `python -X importtime` by benchmarks/bench_startup.py.
+
+run from the repository folder: python -m pytest tests
+"""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+import bench_startup  # noqa: E402
+
+
+@pytest.mark.parametrize("module", list(bench_startup.LAZY))
+def test_import_has_no_side_effects(module):
+    result = bench_startup.measure(module, runs=1)
+    assert bench_startup.problems(module, result) == []
+    assert result['importtime_ms'] > 0